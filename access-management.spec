@@ -21,7 +21,7 @@ License:        %{_platform_license}
 Vendor:         %{_platform_vendor}
 Source0:        %{name}-%{version}.tar.gz
 BuildArch:      noarch
-Requires:       python-flask, python2-flask-restful, python2-configparser, mod_wsgi, python2-peewee
+Requires:       python-flask, python2-flask-restful, python2-configparser, mod_wsgi, python2-peewee, python2-gunicorn, python2-futures
 BuildRequires:  python python-setuptools
 
 %description
@@ -33,6 +33,7 @@ This RPM contains Access Management component for Akraino REC blueprint
 %install
 mkdir -p %{buildroot}%{_python_site_packages_path}/access_management
 mkdir -p %{buildroot}/var/log/access_management
+mkdir -p %{buildroot}/var/lib/access_management/jobs
 
 mkdir -p %{buildroot}%{_python_site_packages_path}/yarf/handlers/am
 rsync -ra src/access_management/rest-plugin/* %{buildroot}/%{_python_site_packages_path}/yarf/handlers/am
@@ -52,7 +53,9 @@ cd src && python setup.py install --root %{buildroot} --no-compile --install-pur
 %{_python_site_packages_path}/yarf/handlers/am/*
 /etc/required-secrets/am-secrets.yaml
 %dir %attr(0770, access-manager,access-manager) /var/log/access_management
+%dir %attr(0770, access-manager,access-manager) /var/lib/access_management/jobs
 %attr(0755,root, root) %{_platform_bin_path}/auth-server
+%attr(0755,root, root) %{_platform_bin_path}/auth-server-wsgi
 %attr(0644,root, root) %{_unitdir}/auth-server.service
 
 %pre
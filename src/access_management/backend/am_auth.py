@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from requests.exceptions import ConnectTimeout, ReadTimeout
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
 
 import yarf.restfullogger as logger
 from yarf.authentication.base_auth import BaseAuthMethod
+import access_management.backend.authsender as authsender
+import access_management.backend.decisioncache as decisioncache
 from access_management.backend.authsender import AuthSender
 from yarf.restfulargs import RestConfig
 from yarf.helpers import remove_secrets
@@ -34,7 +36,13 @@ class AMAuth(BaseAuthMethod):
         except KeyError as error:
             self.logger.error("Failed to find all the needed parameters. Authentication with AM not possible: {}"
                               .format(str(error)))
-        self.sender = AuthSender(self.host, self.port)
+        self.sender = AuthSender(self.host, self.port,
+                                 pool_size=int(conf.get('pool_size', authsender.DEFAULT_POOL_SIZE)),
+                                 retries=int(conf.get('retries', authsender.DEFAULT_RETRIES)))
+        self.cache = decisioncache.DecisionCache(
+            ttl=float(conf.get('decision_cache_ttl', decisioncache.DEFAULT_TTL)),
+            deny_ttl=float(conf.get('decision_cache_deny_ttl', decisioncache.DEFAULT_DENY_TTL)),
+            max_size=int(conf.get('decision_cache_size', decisioncache.DEFAULT_SIZE)))
 
     @staticmethod
     def get_info(request):
@@ -60,12 +68,23 @@ class AMAuth(BaseAuthMethod):
         except KeyError:
             self.logger.error("Failed to get the authentication token from request")
             return False, ""
+        if token:
+            cached = self.cache.get(token, domain, domain_object, method)
+            if cached is not None:
+                self.logger.debug('Cached decision for accessing the given domain {}: {}'.format(
+                                  remove_secrets(request.full_path), cached[0]))
+                return cached
+
         parameters = {'token': token, 'domain': domain, 'domain_object': domain_object, 'method': method}
         username = ''
         try:
             response = self.sender.send_request(parameters)
             self.logger.debug(response)
 
+            if token and response.get('authorized', None) is not None:
+                self.cache.put(token, domain, domain_object, method, bool(response['authorized']),
+                               response['username'])
+
             if response['username'] != '':
                 username = response['username']
             if response.get('authorized', None) is not None:
@@ -79,7 +98,7 @@ class AMAuth(BaseAuthMethod):
                 else:
                     self.logger.info('Token({}) is not valid for accessing the given domain {}'.format(token,
                                      remove_secrets(request.full_path)))
-        except (ConnectTimeout, ReadTimeout) as e:
+        except (ConnectionError, ConnectTimeout, ReadTimeout) as e:
             self.logger.error('Failed to communicate with the authentication server. The following error occurred: {}'.
                               format(str(e)))
         return False, username
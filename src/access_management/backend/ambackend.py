@@ -18,32 +18,98 @@
 ambackend module
 Authorization backend of AM
 """
+import threading
+
 from keystoneauth1.identity import v3
 from keystoneauth1 import session
 from keystoneclient.v3 import client
 from keystoneclient.v3.tokens import TokenManager
 from keystoneauth1.exceptions.http import Unauthorized, NotFound
 
-from access_management.db.amdb import AMDatabase, NotExist
+from access_management.db.amdb import AMDatabase, NotExist, pool_options
+import access_management.backend.metrics as metricsmod
+import access_management.backend.permissiontrie as permissiontrie
+import access_management.backend.rbacsnapshot as rbacsnapshot
+import access_management.backend.singleflight as singleflight
+import access_management.backend.stagetimer as stagetimer
+import access_management.backend.tokencache as tokencache
+import access_management.backend.tokenvalidator as tokenvalidator
 import access_management.backend.restlogger as restlog
 import access_management.config.defaults as defaults
 
+AUTHORIZED = "authorized"
+DENIED = "denied"
+TOKEN_INVALID = "token_invalid"
+BACKEND_ERROR = "backend_error"
+
 
 class AMBackend(object):
     """
     Authorization backend of AM
     """
-    def __init__(self, config):
+    def __init__(self, config, metrics=None):
         """
         Creates an instance of the authorization module
         Parses config and creates AMDB instance
+
+        :param config: parsed configuration
+        :param metrics: Metrics instance the decisions and errors are counted in
         """
         self.config = config
+        self.metrics = metrics if metrics is not None else metricsmod.Metrics()
+        self.request = threading.local()
         self.logger = restlog.get_logger(self.config)
 
         self.db = AMDatabase(db_name=self.config["DB"]["name"], db_addr=self.config["DB"]["addr"],
                              db_port=int(self.config["DB"]["port"]), db_user=self.config["DB"]["user"],
-                             db_pwd=self.config["DB"]["pwd"], logger=self.logger)
+                             db_pwd=self.config["DB"]["pwd"], logger=self.logger,
+                             **pool_options(self.config["DB"]))
+
+        keystone_config = self.config.get("Keystone", {})
+        self.token_cache = tokencache.TokenCache(
+            ttl=int(keystone_config.get("token_cache_ttl", tokencache.DEFAULT_TTL)),
+            max_size=int(keystone_config.get("token_cache_size", tokencache.DEFAULT_SIZE)))
+        self.validator = tokenvalidator.create_validator(self.config)
+
+        coalesce_timeout = float(self.config.get("Api", {}).get("coalesce_timeout", singleflight.DEFAULT_TIMEOUT))
+        self.validations = singleflight.SingleFlight(timeout=coalesce_timeout)
+        self.loads = singleflight.SingleFlight(timeout=coalesce_timeout)
+
+        api_config = self.config.get("Api", {})
+        timers_enabled = api_config.get("stage_timers", "false").lower() == "true"
+        stage_histograms = None
+        if timers_enabled:
+            # shared with the metrics, so that they are added up over the workers
+            stage_histograms = dict((stage, self.metrics.histogram(metricsmod.STAGE_DURATION, (("stage", stage),)))
+                                    for stage in stagetimer.STAGES)
+        self.timers = stagetimer.StageTimers(
+            enabled=timers_enabled,
+            slow_threshold=float(api_config.get("slow_threshold_ms", 0)) / 1000,
+            logger=self.logger,
+            histograms=stage_histograms)
+
+        self.snapshots = None
+        if self.config["DB"].get("rbac_snapshot", "false").lower() == "true":
+            self.snapshots = rbacsnapshot.RBACSnapshotManager(
+                self.db, self.logger,
+                probe_interval=float(self.config["DB"].get("rbac_probe_interval",
+                                                           rbacsnapshot.DEFAULT_PROBE_INTERVAL)),
+                refresh_interval=float(self.config["DB"].get("rbac_refresh_interval",
+                                                             rbacsnapshot.DEFAULT_REFRESH_INTERVAL)))
+            self.snapshots.start()
+
+    def shutdown(self):
+        """
+        Releases the resources of the backend
+        """
+        if self.snapshots is not None:
+            self.snapshots.stop()
+        try:
+            self.db.close()
+        except Exception as error:
+            self.logger.error("Failure: {}".format(str(error)))
+        if self.validator is not None:
+            self.validator.close()
 
     def is_authorized(self, token, domain="", domain_object="", method="", role_name=""):
         """
@@ -57,83 +123,47 @@ class AMBackend(object):
         :returns: authorization result
         :rtype: bool
         """
+        self.timers.begin()
+        self.request.failure = None
+        try:
+            authorized, username = self._is_authorized(token, domain, domain_object, method, role_name)
+        finally:
+            self.timers.end("{0} {1}/{2} {3}", method, domain, domain_object, role_name)
+        self._count_decisions("role" if role_name else "endpoint", [authorized])
+        return authorized, username
 
+    def _is_authorized(self, token, domain, domain_object, method, role_name):
         if domain == "am" and domain_object == "users/ownpasswords":
             return True, ""
 
-        tokenmanager = self.make_auth(token)
-        username = ""
-
-        try:
-            tokeninfo = tokenmanager.validate(token)
-        except Unauthorized as error:
-            self.logger.error("Failed to authenticate with given credentials: {}".format(str(error)))
-            return False, username
-        except NotFound:
-            self.logger.error("Unauthorized token")
-            return False, username
-        except Exception as error:
-            self.logger.error("Failure: {}".format(str(error)))
+        user_uuid, username = self.authenticate(token)
+        if user_uuid is None:
             return False, username
 
-        user_uuid = tokeninfo.user_id
-        username = tokeninfo.username
         endpoint = {}
         endpoint["name"] = domain+"/"+domain_object
 
         if endpoint["name"] != "/":
             self.logger.debug("Endpoint checking")
-            try:
-                self.db.connect()
-            except Exception as error:
-                self.logger.error("Failure: {}".format(str(error)))
+            state, matcher = self._get_matcher(user_uuid)
+            if not state:
                 return False, username
-            try:
-                permissions = self.db.get_user_resources(user_uuid)
-            except Exception as error:
-                self.logger.error("Failure: {}".format(str(error)))
+
+            with self.timers.stage(stagetimer.MATCH):
+                result, path = matcher.match(endpoint["name"], method)
+            self.logger.debug("Matching permission: {0}".format(path))
+            if result == permissiontrie.ALLOWED:
+                self.logger.info("Endpoint authorization successful")
+                return True, username
+            elif result == permissiontrie.METHOD_DENIED:
+                self.logger.error("Unauthorized request 1")
                 return False, username
-            finally:
-                try:
-                    self.db.close()
-                except Exception as error:
-                    self.logger.error("Failure: {}".format(str(error)))
-                    return False, username
-
-
-            endpoint["splitted"] = endpoint["name"].split("/")
-            endpoint["length"] = len(endpoint["splitted"])
-            for path in permissions:
-                per_result = self.check_permission(path, endpoint)
-                if per_result:
-                    met_result = method in permissions[path]
-                    if met_result:
-                        self.logger.info("Endpoint authorization successful")
-                        return True, username
-                    else:
-                        self.logger.error("Unauthorized request 1")
-                        return False, username
-                else:
-                    continue
 
         if role_name != "":
             self.logger.debug("Role checking")
-            try:
-                self.db.connect()
-            except Exception as error:
-                self.logger.error("Failure: {}".format(str(error)))
+            state, permissions = self._get_roles(user_uuid)
+            if not state:
                 return False, username
-            try:
-                permissions = self.db.get_user_roles(user_uuid)
-            except Exception as error:
-                self.logger.error("Failure: {}".format(str(error)))
-                return False, username
-            finally:
-                try:
-                    self.db.close()
-                except Exception as error:
-                    self.logger.error("Failure: {}".format(str(error)))
-                    return False, username
 
             if role_name in permissions:
                 self.logger.info("Role name authorization successful")
@@ -142,27 +172,256 @@ class AMBackend(object):
         self.logger.error("Unauthorized request 2")
         return False, username
 
-    def check_permission(self, key, endpoint):
+    def is_authorized_batch(self, token, endpoints, role_names=()):
         """
-        Checks the permission
+        Does several authorization checks for the same token
+        The token is validated once and the permissions of the user are loaded once
 
-        :param key: permission from the DB
-        :param endpoint: endpoint of the request
-        :returns: checking result
-        :rtype: bool
+        :param token: keystone token
+        :param endpoints: list of (domain, domain_object, method) tuples
+        :param role_names: list of role names
+        :returns: decisions of the endpoints, decisions of the roles and the username
+        :rtype: tuple(list[bool], list[bool], str)
+        """
+        self.timers.begin()
+        self.request.failure = None
+        try:
+            decisions, role_decisions, username = self._is_authorized_batch(token, endpoints, role_names)
+        finally:
+            self.timers.end("batch of {0} endpoints and {1} roles", len(endpoints), len(role_names))
+        self._count_decisions("batch", decisions + role_decisions)
+        return decisions, role_decisions, username
+
+    def _count_decisions(self, kind, decisions):
+        """
+        Counts the decisions of a request by outcome
+        Denials caused by an invalid token or a failing Keystone or DB are counted as such.
+        """
+        failure = self.request.failure or DENIED
+        allowed = decisions.count(True)
+        if allowed:
+            self.metrics.inc(metricsmod.DECISIONS, (("kind", kind), ("outcome", AUTHORIZED)), allowed)
+        if len(decisions) > allowed:
+            self.metrics.inc(metricsmod.DECISIONS, (("kind", kind), ("outcome", failure)), len(decisions) - allowed)
+
+    def _is_authorized_batch(self, token, endpoints, role_names):
+        decisions = [False] * len(endpoints)
+        role_decisions = [False] * len(role_names)
+        to_check = []
+        for index, (domain, domain_object, method) in enumerate(endpoints):
+            if domain == "am" and domain_object == "users/ownpasswords":
+                decisions[index] = True
+            elif domain+"/"+domain_object != "/":
+                to_check.append(index)
+
+        if not to_check and not role_names:
+            return decisions, role_decisions, ""
+
+        user_uuid, username = self.authenticate(token)
+        if user_uuid is None:
+            return decisions, role_decisions, username
+
+        if to_check:
+            state, matcher = self._get_matcher(user_uuid)
+            if state:
+                with self.timers.stage(stagetimer.MATCH):
+                    for index in to_check:
+                        domain, domain_object, method = endpoints[index]
+                        result, path = matcher.match(domain+"/"+domain_object, method)
+                        decisions[index] = result == permissiontrie.ALLOWED
+
+        if role_names:
+            state, roles = self._get_roles(user_uuid)
+            if state:
+                role_decisions = [role_name in roles for role_name in role_names]
+
+        self.logger.info("Batch authorization done: {0} of {1} endpoints and {2} of {3} roles allowed"
+                         .format(decisions.count(True), len(decisions), role_decisions.count(True),
+                                 len(role_decisions)))
+        return decisions, role_decisions, username
+
+    def authenticate(self, token):
         """
-        key_splitted = key.split("/")
-        key_length = len(key_splitted)
-        if key_length == 1 and endpoint["splitted"][0] == key:
-            return True
-        if endpoint["length"] != key_length:
-            return False
-        for i in range(0, endpoint["length"]):
-            if key_splitted[i][0] == "<":
-                continue
-            if endpoint["splitted"][i] != key_splitted[i]:
-                return False
-        return True
+        Validates the token, using the token cache when possible
+
+        :param token: keystone token
+        :returns: user_id and username of the token's owner, user_id is None if the token is not valid
+        :rtype: tuple(str, str)
+        """
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        try:
+            with self.timers.stage(stagetimer.KEYSTONE):
+                tokeninfo = self.validations.do(tokencache.TokenCache.token_key(token), self._validate, token)
+        except Unauthorized as error:
+            if self.validator is None:
+                # in user mode the token itself is rejected
+                self.logger.error("Unauthorized token")
+                self.request.failure = TOKEN_INVALID
+            else:
+                self.logger.error("Failed to authenticate with given credentials: {}".format(str(error)))
+                self.request.failure = BACKEND_ERROR
+            return None, ""
+        except NotFound:
+            self.logger.error("Unauthorized token")
+            self.request.failure = TOKEN_INVALID
+            return None, ""
+        except Exception as error:
+            self.logger.error("Failure: {}".format(str(error)))
+            self.request.failure = BACKEND_ERROR
+            return None, ""
+
+        self.token_cache.put(token, tokeninfo.user_id, tokeninfo.username, tokeninfo.expires)
+        return tokeninfo.user_id, tokeninfo.username
+
+    def _validate(self, token):
+        """
+        Validates the token, counting the failures of Keystone
+        Unknown tokens and, in user mode, rejected tokens are not failures of Keystone.
+        """
+        try:
+            return self.validate_token(token)
+        except NotFound:
+            raise
+        except Unauthorized:
+            if self.validator is not None:
+                self.metrics.inc(metricsmod.KEYSTONE_ERRORS)
+            raise
+        except Exception:
+            self.metrics.inc(metricsmod.KEYSTONE_ERRORS)
+            raise
+
+    def _get_matcher(self, user_uuid):
+        """
+        Returns the compiled permissions of the user from the RBAC snapshot,
+        or from the DB if there is no snapshot or the user is newer than the snapshot.
+        The DB path reads the RBAC version and role ids of the user first and loads
+        the permissions only if no trie is cached for them.
+
+        :param user_uuid: user identifier
+        :returns: state and the compiled permissions
+        :rtype: tuple(bool, PermissionTrie)
+        """
+        snapshot = self.snapshots.current if self.snapshots is not None else None
+        if snapshot is not None and snapshot.has_user(user_uuid):
+            return True, snapshot.get_matcher(user_uuid)
+        state, key = self._load_user_data(self.db.get_user_permission_key, user_uuid)
+        if not state:
+            return False, None
+        matcher = permissiontrie.find_matcher(key)
+        if matcher is not None:
+            return True, matcher
+        state, permissions = self._load_user_data(self.db.get_user_resources, user_uuid)
+        if not state:
+            return False, None
+        return True, permissiontrie.get_matcher(key, permissions)
+
+    def _get_roles(self, user_uuid):
+        """
+        Returns the role names of the user from the RBAC snapshot,
+        or from the DB if there is no snapshot or the user is newer than the snapshot
+
+        :param user_uuid: user identifier
+        :returns: state and the role names
+        :rtype: tuple(bool, list[str])
+        """
+        snapshot = self.snapshots.current if self.snapshots is not None else None
+        if snapshot is not None and snapshot.has_user(user_uuid):
+            return True, snapshot.get_user_roles(user_uuid)
+        return self._load_user_data(self.db.get_user_roles, user_uuid)
+
+    def _load_user_data(self, query, user_uuid):
+        """
+        Runs a query of the user, sharing the result with the identical queries running at the same time
+
+        :param query: AMDatabase method to call
+        :param user_uuid: user identifier
+        :returns: state and result of the query
+        :rtype: tuple(bool, object)
+        """
+        try:
+            state, result = self.loads.do((query.__name__, user_uuid), self._query_db, query, user_uuid)
+        except singleflight.SingleFlightTimeout as error:
+            self.logger.error("Failure: {}".format(str(error)))
+            self.request.failure = BACKEND_ERROR
+            return False, None
+        if state is None:
+            self.request.failure = BACKEND_ERROR
+            return False, None
+        return state, result
+
+    def _query_db(self, query, user_uuid):
+        """
+        Runs a query of the user in its own DB connection
+
+        :param query: AMDatabase method to call
+        :param user_uuid: user identifier
+        :returns: state and result of the query, the state is None if the DB failed
+        :rtype: tuple(bool, object)
+        """
+        try:
+            with self.timers.stage(stagetimer.DB_CONNECT):
+                self.db.connect()
+        except Exception as error:
+            self.logger.error("Failure: {}".format(str(error)))
+            self.metrics.inc(metricsmod.DB_ERRORS)
+            return None, None
+        try:
+            with self.timers.stage(stagetimer.DB_QUERY):
+                result = query(user_uuid)
+        except NotExist as error:
+            self.logger.error("Failure: {}".format(str(error)))
+            return False, None
+        except Exception as error:
+            self.logger.error("Failure: {}".format(str(error)))
+            self.metrics.inc(metricsmod.DB_ERRORS)
+            return None, None
+        finally:
+            try:
+                self.db.close()
+            except Exception as error:
+                self.logger.error("Failure: {}".format(str(error)))
+                self.metrics.inc(metricsmod.DB_ERRORS)
+                return None, None
+        return True, result
+
+    def metric_samples(self):
+        """
+        Returns the statistics of the caches of the backend for the metrics endpoint
+
+        :returns: list of (name, labels, value) tuples
+        :rtype: list[tuple]
+        """
+        token_stats = self.token_cache.stats()
+        samples = [(metricsmod.TOKEN_CACHE_LOOKUPS, (("result", "hit"),), token_stats["hits"]),
+                   (metricsmod.TOKEN_CACHE_LOOKUPS, (("result", "miss"),), token_stats["misses"]),
+                   (metricsmod.TOKEN_CACHE_REMOVALS, (("reason", "eviction"),), token_stats["evictions"]),
+                   (metricsmod.TOKEN_CACHE_REMOVALS, (("reason", "expiration"),), token_stats["expirations"]),
+                   (metricsmod.TOKEN_CACHE_SIZE, (), token_stats["size"])]
+        for call, flight in (("keystone", self.validations), ("db", self.loads)):
+            flight_stats = flight.stats()
+            samples.append((metricsmod.COALESCED_CALLS, (("call", call), ("role", "leader")), flight_stats["leaders"]))
+            samples.append((metricsmod.COALESCED_CALLS, (("call", call), ("role", "follower")),
+                            flight_stats["followers"]))
+        if self.snapshots is not None:
+            samples.append((metricsmod.RBAC_SNAPSHOT_REFRESHES, (), self.snapshots.refreshes))
+            samples.append((metricsmod.RBAC_SNAPSHOT_FAILURES, (), self.snapshots.failures))
+        return samples
+
+    def validate_token(self, token):
+        """
+        Validates the token with the configured validation mode
+
+        :param token: keystone token
+        :returns: information about the token
+        :rtype: keystoneauth1.access.AccessInfo
+        """
+        if self.validator is not None:
+            return self.validator.validate(token)
+        tokenmanager = self.make_auth(token)
+        return tokenmanager.validate(token)
 
     def make_auth(self, token):
         """
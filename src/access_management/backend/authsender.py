@@ -12,22 +12,71 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 2
 
 
 class AuthSender(object):
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES):
         self.url = "http://{0}:{1}/authorize/endpoint".format(host, port)
+        self.batch_url = "http://{0}:{1}/authorize/batch".format(host, port)
         self.headers = {'content-type': 'application/json'}
-        self.counter = 0
+        # next() of itertools.count is atomic, so request ids are unique across threads
+        self.counter = itertools.count()
+        self.session = self._make_session(pool_size, retries)
+
+    @staticmethod
+    def _make_session(pool_size, retries):
+        """
+        Creates the keep-alive session towards the auth-server
+        Authorization requests do not change anything, so POSTs are retried as well.
+        Only failed connections are retried, a read timeout fails at once instead of
+        blocking the caller for several timeouts.
+        """
+        try:
+            retry = Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.1,
+                          allowed_methods=False)
+        except TypeError:
+            retry = Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.1,
+                          method_whitelist=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        return session
 
     def send_request(self, data):
+        return self._post(self.url, data)
+
+    def send_batch(self, token, endpoints, roles=None):
+        """
+        Asks several authorization decisions for the same token at once
+
+        :param token: keystone token
+        :param endpoints: list of (domain, domain_object, method) tuples
+        :param roles: list of role names
+        :returns: dict with the decisions of the endpoints under 'authorized',
+                  the decisions of the roles under 'roles' and the 'username'
+        """
+        data = {'token': token,
+                'requests': [{'domain': domain, 'domain_object': domain_object, 'method': method}
+                             for domain, domain_object, method in endpoints],
+                'roles': roles or []}
+        return self._post(self.batch_url, data)
+
+    def _post(self, url, data):
         payload = {
             "method": 'post',
             "params": json.dumps(data),
-            "id": self.counter,
+            "id": next(self.counter),
         }
-        self.counter += 1
-        return requests.post(self.url, data=json.dumps(payload), headers=self.headers, timeout=10).json()
+        return self.session.post(url, data=json.dumps(payload), headers=self.headers, timeout=10).json()
+
+    def close(self):
+        self.session.close()
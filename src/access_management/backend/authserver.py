@@ -13,22 +13,82 @@
 # limitations under the License.
 
 import json
+import signal
 import sys
+import threading
+import time
 
-from flask import Flask, request
+from flask import Flask, Response, g, request
 from flask_restful import Resource, Api
 from access_management.backend.ambackend import AMBackend
+import access_management.backend.metrics as metricsmod
 from access_management.config.amconfigparser import AMConfigParser
 import access_management.backend.restlogger as restlog
 from werkzeug.exceptions import InternalServerError
 
+CONFIG_FILE = "/etc/access_management/am_backend_config.ini"
+
 app = Flask(__name__)
 api = Api(app)
 
+backend = None
+backend_lock = threading.Lock()
+metrics = None
+
+
+def get_backend():
+    """
+    Returns the authorization backend shared by the request threads of the worker
+    """
+    current = backend
+    if current is None:
+        current = startup(config)
+    return current
+
+
+def startup(new_config):
+    """
+    Creates the long-lived authorization backend of the worker
+    Does nothing if the backend is already running
+    """
+    global backend
+    with backend_lock:
+        if backend is None:
+            backend = AMBackend(new_config, metrics)
+        return backend
+
+
+def shutdown():
+    """
+    Releases the authorization backend of the worker
+    """
+    global backend
+    if metrics is not None:
+        metrics.stop()
+    with backend_lock:
+        old_backend, backend = backend, None
+    if old_backend is not None:
+        old_backend.shutdown()
+
+
+def reload_backend(new_config):
+    """
+    Replaces the authorization backend with one built from the given config
+    Requests already running finish with the old backend
+    """
+    global backend, config
+    new_backend = AMBackend(new_config, metrics)
+    with backend_lock:
+        old_backend, backend = backend, new_backend
+        config = new_config
+    if old_backend is not None:
+        old_backend.shutdown()
+    return new_backend
+
 
 class AuthorizeEndpoint(Resource):
     def post(self):
-        backend = AMBackend(config)
+        backend = get_backend()
         params = json.loads(request.json['params'])
         authorized, username = backend.is_authorized(token=params['token'], domain=params['domain'],
                                                      domain_object=params['domain_object'], method=params['method'])
@@ -37,11 +97,32 @@ class AuthorizeEndpoint(Resource):
 
 class AuthorizeRole(Resource):
     def post(self):
-        backend = AMBackend(config)
+        backend = get_backend()
         authorized, username = backend.is_authorized(token=request.json['token'], role_name=request.json['role'])
         return {'authorized': authorized, 'username': username}
 
 
+class AuthorizeBatch(Resource):
+    def post(self):
+        backend = get_backend()
+        params = json.loads(request.json['params'])
+        endpoints = [(item['domain'], item['domain_object'], item['method']) for item in params['requests']]
+        decisions, role_decisions, username = backend.is_authorized_batch(token=params['token'], endpoints=endpoints,
+                                                                          role_names=params.get('roles', []))
+        return {'authorized': decisions, 'roles': role_decisions, 'username': username}
+
+
+class LatencyStats(Resource):
+    def get(self):
+        # the stage histograms of all the workers, added up like the other metrics
+        return metrics.collect_histograms(metricsmod.STAGE_DURATION, "stage")
+
+
+class Metrics(Resource):
+    def get(self):
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 # class DumpTables(Resource):
 #     def get(self):
 #         backend = AMBackend(config)
@@ -51,28 +132,57 @@ class AuthorizeRole(Resource):
 
 api.add_resource(AuthorizeEndpoint, '/authorize/endpoint')
 api.add_resource(AuthorizeRole, '/authorize/role')
+api.add_resource(AuthorizeBatch, '/authorize/batch')
+api.add_resource(LatencyStats, '/stats/latency')
+api.add_resource(Metrics, '/metrics')
 # api.add_resource(DumpTables, '/dumptables')
 
 
 def main():
     global config
-    configparser = AMConfigParser("/etc/access_management/am_backend_config.ini")
+    configparser = AMConfigParser(CONFIG_FILE)
     config = configparser.parse()
     logger = restlog.get_logger(config)
     initialize(config,logger)
-    app.run(host=config["Api"]["host"], port=int(config["Api"]["port"]), debug=True)
+    signal.signal(signal.SIGHUP, handle_sighup)
+    try:
+        app.run(host=config["Api"]["host"], port=int(config["Api"]["port"]), debug=True)
+    finally:
+        shutdown()
 
 
 def initialize(config, logger):
+    global metrics
     logger.info("Initializing...")
+    api_config = config.get("Api", {})
+    metrics = metricsmod.Metrics(directory=api_config.get("metrics_dir"),
+                                 flush_interval=float(api_config.get("metrics_flush_interval",
+                                                                     metricsmod.DEFAULT_FLUSH_INTERVAL)),
+                                 logger=logger)
+    metrics.add_collector(backend_metric_samples)
+    metrics.start()
     app.register_error_handler(Exception, handle_exp)
     app.before_request(request_logger)
     app.after_request(response_logger)
     app.logger.addHandler(restlog.get_log_handler(config))
+    startup(config)
     logger.info("Starting up...")
 
 
+def handle_sighup(signum, frame):
+    app.logger.info("Reloading the configuration...")
+    reload_backend(AMConfigParser(CONFIG_FILE).parse())
+
+
+def backend_metric_samples():
+    current = backend
+    if current is None:
+        return []
+    return current.metric_samples()
+
+
 def request_logger():
+    g.start_time = time.time()
     app.logger.info('Request: remote_addr: %s method: %s endpoint: %s', request.remote_addr, request.method,
                     request.full_path)
 
@@ -83,6 +193,12 @@ def response_logger(response):
 
     app.logger.debug('Response\'s data: %s', response.data)
 
+    if metrics is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "other"
+        metrics.inc(metricsmod.REQUESTS, (("route", route), ("code", str(response.status_code))))
+        if "start_time" in g:
+            metrics.observe(metricsmod.REQUEST_DURATION, (("route", route),), time.time() - g.start_time)
+
     return response
 
 
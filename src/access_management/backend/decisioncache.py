@@ -0,0 +1,113 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+decisioncache module
+Client side cache of the auth-server's decisions
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 0
+DEFAULT_DENY_TTL = 2
+DEFAULT_SIZE = 4096
+
+
+class DecisionCache(object):
+    """
+    LRU cache of authorization decisions
+    Entries are keyed by the hash of the token, the domain, the domain object and the method.
+    Denials live for their own, usually shorter, TTL.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, deny_ttl=DEFAULT_DENY_TTL, max_size=DEFAULT_SIZE):
+        """
+        Creates the cache
+
+        :param ttl: lifetime of a positive decision in seconds, 0 disables the cache
+        :param deny_ttl: lifetime of a negative decision in seconds, 0 disables caching denials
+        :param max_size: maximum number of entries
+        """
+        self.ttl = ttl
+        self.deny_ttl = deny_ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    @staticmethod
+    def decision_key(token, domain, domain_object, method):
+        return hashlib.sha256(token).hexdigest(), domain, domain_object, method
+
+    def get(self, token, domain, domain_object, method):
+        """
+        Looks up a decision
+
+        :returns: tuple of the decision and the username, None if the decision is not cached
+        :rtype: tuple(bool, str)
+        """
+        if not self.enabled:
+            return None
+        key = self.decision_key(token, domain, domain_object, method)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, token, domain, domain_object, method, authorized, username):
+        """
+        Stores a decision of the auth-server
+        """
+        if not self.enabled:
+            return
+        ttl = self.ttl if authorized else self.deny_ttl
+        if ttl <= 0:
+            return
+        key = self.decision_key(token, domain, domain_object, method)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + ttl, authorized, username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Returns the counters of the cache
+
+        :rtype: dict
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit_rate": float(self.hits) / lookups if lookups else 0.0}
@@ -0,0 +1,331 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+metrics module
+Counters of the auth-server in Prometheus text format
+"""
+import glob
+import json
+import os
+import threading
+import time
+
+from access_management.backend.stagetimer import Histogram
+
+DEFAULT_FLUSH_INTERVAL = 5
+
+# counters and histograms of the exited workers, written by the master only
+TOTALS_FILE = "totals.json"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+REQUESTS = "authserver_requests_total"
+REQUEST_DURATION = "authserver_request_duration_seconds"
+DECISIONS = "authserver_decisions_total"
+KEYSTONE_ERRORS = "authserver_keystone_errors_total"
+DB_ERRORS = "authserver_db_errors_total"
+TOKEN_CACHE_LOOKUPS = "authserver_token_cache_lookups_total"
+TOKEN_CACHE_REMOVALS = "authserver_token_cache_removals_total"
+TOKEN_CACHE_SIZE = "authserver_token_cache_size"
+COALESCED_CALLS = "authserver_coalesced_calls_total"
+RBAC_SNAPSHOT_REFRESHES = "authserver_rbac_snapshot_refreshes_total"
+RBAC_SNAPSHOT_FAILURES = "authserver_rbac_snapshot_failures_total"
+STAGE_DURATION = "authserver_authorization_stage_duration_seconds"
+
+DEFINITIONS = {
+    REQUESTS: (COUNTER, "Requests served, by route and status code"),
+    REQUEST_DURATION: (HISTOGRAM, "Request latency in seconds, by route"),
+    DECISIONS: (COUNTER, "Authorization decisions, by kind and outcome"),
+    KEYSTONE_ERRORS: (COUNTER, "Failed token validations other than unknown tokens"),
+    DB_ERRORS: (COUNTER, "Failed DB connects and queries"),
+    TOKEN_CACHE_LOOKUPS: (COUNTER, "Token cache lookups, by result"),
+    TOKEN_CACHE_REMOVALS: (COUNTER, "Entries removed from the token cache, by reason"),
+    TOKEN_CACHE_SIZE: (GAUGE, "Entries in the token cache"),
+    COALESCED_CALLS: (COUNTER, "Keystone and DB calls, by whether they ran or waited for an identical call"),
+    RBAC_SNAPSHOT_REFRESHES: (COUNTER, "Rebuilds of the RBAC snapshot"),
+    RBAC_SNAPSHOT_FAILURES: (COUNTER, "Failed refreshes of the RBAC snapshot"),
+    STAGE_DURATION: (HISTOGRAM, "Duration of the stages of the authorizations in seconds, by stage"),
+}
+
+
+class Metrics(object):
+    """
+    Counters and histograms of one process
+    If a directory is given, every process sharing it writes its samples into its own file there
+    and collect() adds up the files, so the numbers cover all the workers of the server.
+    The file of an exited worker is folded into the totals file by retire_process().
+    """
+    def __init__(self, directory=None, flush_interval=DEFAULT_FLUSH_INTERVAL, logger=None):
+        """
+        :param directory: directory shared by the workers, None keeps the samples in the process
+        :param flush_interval: seconds between two writes of the samples of the process
+        :param logger: logger instance to be used
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.logger = logger
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self.path = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def inc(self, name, labels=(), amount=1):
+        """
+        Increments a counter
+
+        :param name: name of the metric
+        :param labels: tuple of (label, value) pairs
+        :param amount: value to add
+        """
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        """
+        Adds a value to a histogram
+
+        :param name: name of the metric
+        :param labels: tuple of (label, value) pairs
+        :param value: observed value in seconds
+        """
+        self.histogram(name, labels).observe(value)
+
+    def histogram(self, name, labels):
+        """
+        Returns the histogram of a metric, creating it on the first call
+
+        :param name: name of the metric
+        :param labels: tuple of (label, value) pairs
+        :rtype: Histogram
+        """
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def add_collector(self, collector):
+        """
+        Registers a function called on every sampling
+        The function returns a list of (name, labels, value) tuples, typically read from the stats of a cache.
+        """
+        self.collectors.append(collector)
+
+    def start(self):
+        """
+        Starts writing the samples of the process into the shared directory
+        """
+        if self.directory is None:
+            return
+        self.path = os.path.join(self.directory, "{0}-{1}.json".format(os.getpid(), int(time.time() * 1000)))
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="metrics-flush")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Writes the samples a last time so that the numbers of an exited worker are kept
+        """
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(self.flush_interval)
+        self.flush()
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def sample(self):
+        """
+        Returns the current values of the process
+
+        :returns: counters and gauges as (name, labels, value), histograms as (name, labels, buckets, count, sum)
+        :rtype: dict
+        """
+        with self.lock:
+            samples = [(name, labels, value) for (name, labels), value in self.counters.iteritems()]
+            histograms = list(self.histograms.iteritems())
+        for collector in self.collectors:
+            try:
+                samples.extend(collector())
+            except Exception as error:
+                if self.logger is not None:
+                    self.logger.error("Failed to collect metrics: {}".format(str(error)))
+        ret = {"samples": samples, "histograms": []}
+        for (name, labels), histogram in histograms:
+            values = histogram.get()
+            ret["histograms"].append((name, labels, values["buckets"], values["count"], values["sum"]))
+        return ret
+
+    def flush(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as tmp_file:
+                json.dump(self.sample(), tmp_file)
+            os.rename(tmp_path, self.path)
+        except Exception as error:
+            if self.logger is not None:
+                self.logger.error("Failed to write metrics: {}".format(str(error)))
+
+    def collect(self):
+        """
+        Returns the values added up over all the processes sharing the directory
+
+        :rtype: dict
+        """
+        if self.path is None:
+            return self.sample()
+        self.flush()
+        samples = {}
+        histograms = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            data = _load(path, self.logger)
+            if data is not None:
+                _merge(samples, histograms, data)
+        return _merged(samples, histograms)
+
+    def collect_histograms(self, name, label):
+        """
+        Returns the collected histograms of a metric by the value of one of its labels
+
+        :param name: name of the metric
+        :param label: name of the label
+        :returns: dict where the keys are the label values, values are dicts with the buckets, count and sum
+        :rtype: dict
+        """
+        ret = {}
+        for metric, labels, buckets, count, total in self.collect()["histograms"]:
+            values = dict(labels)
+            if metric == name and label in values:
+                ret[values[label]] = {"buckets": [tuple(bucket) for bucket in buckets], "count": count, "sum": total}
+        return ret
+
+    def render(self):
+        """
+        Returns the collected values in Prometheus text format
+
+        :rtype: str
+        """
+        collected = self.collect()
+        lines_of = {}
+        for name, labels, value in sorted(collected["samples"]):
+            lines_of.setdefault(name, []).append("{0}{1} {2}".format(name, _labels(labels), _number(value)))
+        for name, labels, buckets, count, total in sorted(collected["histograms"]):
+            lines = lines_of.setdefault(name, [])
+            for bound, bucket_count in buckets:
+                le = bound if isinstance(bound, basestring) else repr(float(bound))
+                lines.append("{0}_bucket{1} {2}".format(name, _labels(tuple(labels) + (("le", le),)), bucket_count))
+            lines.append("{0}_sum{1} {2}".format(name, _labels(labels), _number(total)))
+            lines.append("{0}_count{1} {2}".format(name, _labels(labels), count))
+
+        output = []
+        for name in sorted(lines_of):
+            metric_type, description = DEFINITIONS.get(name, ("untyped", name))
+            output.append("# HELP {0} {1}".format(name, description))
+            output.append("# TYPE {0} {1}".format(name, metric_type))
+            output.extend(lines_of[name])
+        return "\n".join(output) + "\n"
+
+
+def retire_process(directory, pid, logger=None):
+    """
+    Folds the counters and histograms of an exited process into the totals file and removes its file
+    The gauges of the process are dropped, so collect() reports gauges of live processes only.
+
+    :param directory: directory shared by the processes
+    :param pid: process id of the exited process
+    :param logger: logger instance to be used
+    """
+    paths = glob.glob(os.path.join(directory, "{0}-*.json".format(pid)))
+    if not paths:
+        return
+    totals_path = os.path.join(directory, TOTALS_FILE)
+    samples = {}
+    histograms = {}
+    if os.path.exists(totals_path):
+        data = _load(totals_path, logger)
+        if data is not None:
+            _merge(samples, histograms, data)
+    for path in paths:
+        data = _load(path, logger)
+        if data is not None:
+            _merge(samples, histograms, data, gauges=False)
+    tmp_path = totals_path + ".tmp"
+    try:
+        with open(tmp_path, "w") as tmp_file:
+            json.dump(_merged(samples, histograms), tmp_file)
+        os.rename(tmp_path, totals_path)
+        for path in paths:
+            os.remove(path)
+    except Exception as error:
+        if logger is not None:
+            logger.error("Failed to fold the metrics of process {0}: {1}".format(pid, str(error)))
+
+
+def _load(path, logger):
+    try:
+        with open(path) as sample_file:
+            return json.load(sample_file)
+    except Exception as error:
+        if logger is not None:
+            logger.error("Failed to read metrics from {0}: {1}".format(path, str(error)))
+        return None
+
+
+def _merge(samples, histograms, data, gauges=True):
+    """
+    Adds the samples and histograms of a metrics file to the dicts keyed by (name, labels)
+    """
+    for name, labels, value in data["samples"]:
+        if not gauges and DEFINITIONS.get(name, (COUNTER,))[0] == GAUGE:
+            continue
+        key = (name, tuple(tuple(label) for label in labels))
+        samples[key] = samples.get(key, 0) + value
+    for name, labels, buckets, count, total in data["histograms"]:
+        key = (name, tuple(tuple(label) for label in labels))
+        merged = histograms.setdefault(key, [[[bound, 0] for bound, _ in buckets], 0, 0.0])
+        for index, (_, bucket_count) in enumerate(buckets):
+            merged[0][index][1] += bucket_count
+        merged[1] += count
+        merged[2] += total
+
+
+def _merged(samples, histograms):
+    return {"samples": [(name, labels, value) for (name, labels), value in samples.iteritems()],
+            "histograms": [(name, labels, buckets, count, total)
+                           for (name, labels), (buckets, count, total) in histograms.iteritems()]}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(label, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for label, value in labels) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -0,0 +1,293 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+passwordchecker module
+In-process replacement of cracklib-check
+"""
+import array
+import bisect
+import gzip
+import mmap
+import os
+import re
+import struct
+import subprocess
+import threading
+
+DEFAULT_DICTIONARY = "/usr/share/cracklib/pw_dict"
+
+# cracklib's packed dictionary format
+PIH_MAGIC = 0x70775631
+NUMWORDS = 16
+
+# size of the bit array of the filter, gives about 1.5% false positives with the two hashes
+FILTER_BITS_PER_WORD = 16
+
+MINDIFF = 5
+MAXSTEP = 4
+MIN_WORD_LENGTH = 4
+
+NON_LETTERS = re.compile("[^a-z]")
+DIGITS = re.compile("[0-9]")
+SYMBOLS = re.compile("[^a-z0-9]")
+
+# the digit and symbol substitutions cracklib reverses, ambiguous characters have several letters
+SUBSTITUTIONS = (("0", "o"), ("1", "il"), ("2", "a"), ("3", "e"), ("4", "ah"), ("5", "s"), ("7", "t"),
+                 ("$", "s"), ("@", "a"), ("!", "i"))
+
+
+class WordFilter(object):
+    """
+    Bit array answering most lookups of absent words without searching the dictionary
+    """
+    def __init__(self, count):
+        """
+        :param count: number of words to be added
+        """
+        self.size = max(8, count * FILTER_BITS_PER_WORD)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, word):
+        value = hash(word)
+        return value % self.size, (value // self.size) % self.size
+
+    def add(self, word):
+        for position in self._positions(word):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, word):
+        for position in self._positions(word):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class PackedDictionary(object):
+    """
+    cracklib dictionary (the .pwi index and the .pwd words) searched in place through mmap
+    Words are stored in sorted blocks of 16, each word sharing a prefix with the previous one.
+    Only the first word of every block and the filter are kept in memory.
+    """
+    def __init__(self, path):
+        """
+        :param path: path of the dictionary without the extension, e.g. /usr/share/cracklib/pw_dict
+        """
+        with open(path + ".pwi", "rb") as index_file:
+            self.index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(path + ".pwd", "rb") as data_file:
+            self.data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        for order in ("<", ">"):
+            if struct.unpack_from(order + "Q", self.index, 0)[0] == PIH_MAGIC:
+                self.numwords = struct.unpack_from(order + "Q", self.index, 8)[0]
+                self.entry = struct.Struct(order + "Q")
+                self.header_size = 24
+                break
+            if struct.unpack_from(order + "I", self.index, 0)[0] == PIH_MAGIC:
+                self.numwords = struct.unpack_from(order + "I", self.index, 4)[0]
+                self.entry = struct.Struct(order + "I")
+                self.header_size = 12
+                break
+        else:
+            raise ValueError("{0}.pwi is not a cracklib dictionary".format(path))
+        self.blocks = (self.numwords + NUMWORDS - 1) // NUMWORDS
+        self.first_words = []
+        self.filter = WordFilter(self.numwords)
+        for block in range(self.blocks):
+            words = self._words(block)
+            self.first_words.append(words[0])
+            for word in words:
+                self.filter.add(word)
+
+    def _offset(self, block):
+        return self.entry.unpack_from(self.index, self.header_size + block * self.entry.size)[0]
+
+    def _words(self, block):
+        offset = self._offset(block)
+        count = min(NUMWORDS, self.numwords - block * NUMWORDS)
+        end = self.data.find("\0", offset)
+        words = [self.data[offset:end]]
+        offset = end + 1
+        for _ in range(count - 1):
+            prefix = ord(self.data[offset])
+            end = self.data.find("\0", offset + 1)
+            words.append(words[-1][:prefix] + self.data[offset + 1:end])
+            offset = end + 1
+        return words
+
+    def __contains__(self, word):
+        if word not in self.filter:
+            return False
+        block = bisect.bisect_right(self.first_words, word) - 1
+        return block >= 0 and word in self._words(block)
+
+
+class WordListDictionary(object):
+    """
+    Plain word list, one word per line, optionally gzipped
+    The words are kept sorted in one string with an array of their offsets.
+    """
+    def __init__(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as word_file:
+            words = sorted(set(line.strip().lower() for line in word_file if line.strip()))
+        self.words = "\n".join(words) + "\n"
+        self.offsets = array.array("L", [0])
+        self.filter = WordFilter(len(words))
+        for word in words:
+            self.offsets.append(self.offsets[-1] + len(word) + 1)
+            self.filter.add(word)
+
+    def _word(self, index):
+        return self.words[self.offsets[index]:self.offsets[index + 1] - 1]
+
+    def __contains__(self, word):
+        if word not in self.filter:
+            return False
+        low, high = 0, len(self.offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._word(middle) < word:
+                low = middle + 1
+            else:
+                high = middle
+        return low < len(self.offsets) - 1 and self._word(low) == word
+
+
+def load_dictionary(path):
+    """
+    Loads a cracklib dictionary if path.pwi exists, a word list otherwise
+
+    :param path: path of the dictionary
+    :rtype: PackedDictionary or WordListDictionary
+    """
+    if os.path.exists(path + ".pwi"):
+        return PackedDictionary(path)
+    return WordListDictionary(path)
+
+
+def _substituted(word):
+    """
+    Returns the word with the digits and symbols replaced by the letters they stand for
+    """
+    variants = [word]
+    for symbol, letters in SUBSTITUTIONS:
+        if symbol in word:
+            variants = [variant.replace(symbol, letter) for variant in variants for letter in letters]
+    return variants
+
+
+def candidates(password):
+    """
+    Returns the words a password may be derived from, like the mangling rules of cracklib:
+    lower case, trimmed ends, purged digits and symbols, reversed substitutions,
+    reversal, plurals, duplication and reflection
+
+    :rtype: set[str]
+    """
+    bases = set()
+    for word in [password.strip().lower()] + _substituted(password.strip().lower()):
+        bases.update((word, NON_LETTERS.sub("", word), DIGITS.sub("", word), SYMBOLS.sub("", word)))
+        for count in range(1, 4):
+            bases.add(word[count:])
+            bases.add(word[:-count])
+
+    ret = set()
+    for base in bases:
+        for variant in (base, base[::-1]):
+            ret.add(variant)
+            if variant.endswith("es"):
+                ret.add(variant[:-2])
+            if variant.endswith("s"):
+                ret.add(variant[:-1])
+            half = len(variant) // 2
+            if len(variant) % 2 == 0 and variant[:half] in (variant[half:], variant[half:][::-1]):
+                ret.add(variant[:half])
+    return set(candidate for candidate in ret if len(candidate) >= MIN_WORD_LENGTH)
+
+
+class PasswordChecker(object):
+    """
+    Checks passwords against a dictionary loaded once
+    """
+    def __init__(self, dictionary):
+        """
+        :param dictionary: set-like dictionary of lower case words
+        """
+        self.dictionary = dictionary
+
+    def check(self, password):
+        """
+        Checks a password like cracklib-check
+
+        :param password: password to check
+        :returns: the reason of the rejection, None if the password is accepted
+        :rtype: str
+        """
+        if len(set(password)) < MINDIFF:
+            return "it does not contain enough DIFFERENT characters"
+        lowered = password.lower()
+        steps = sum(1 for first, second in zip(lowered, lowered[1:]) if abs(ord(first) - ord(second)) == 1)
+        if steps > MAXSTEP:
+            return "it is too simplistic/systematic"
+        for candidate in candidates(password):
+            if candidate in self.dictionary:
+                return "it is based on a dictionary word"
+        return None
+
+
+class CracklibCommandChecker(object):
+    """
+    Runs cracklib-check, used when the dictionary cannot be loaded
+    The password is written to the standard input of the command, no shell is involved.
+    """
+    def check(self, password):
+        try:
+            process = subprocess.Popen(["cracklib-check"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            output, _ = process.communicate(password + "\n")
+        except OSError as error:
+            return "cracklib-check failed: {0}".format(error)
+        result = output.rsplit(": ", 1)[-1].strip()
+        if process.returncode != 0 or result != "OK":
+            return result or "cracklib-check failed"
+        return None
+
+
+_checkers = {}
+_checkers_lock = threading.Lock()
+
+
+def get_checker(path=DEFAULT_DICTIONARY, logger=None):
+    """
+    Returns the checker of a dictionary, loading the dictionary on the first call
+
+    :param path: path of the cracklib dictionary or of a word list
+    :param logger: logs the failure of loading the dictionary
+    :rtype: PasswordChecker or CracklibCommandChecker
+    """
+    checker = _checkers.get(path)
+    if checker is None:
+        with _checkers_lock:
+            checker = _checkers.get(path)
+            if checker is None:
+                try:
+                    checker = PasswordChecker(load_dictionary(path))
+                except Exception as error:
+                    if logger is not None:
+                        logger.error("Failed to load the password dictionary {0}: {1}".format(path, error))
+                    checker = CracklibCommandChecker()
+                _checkers[path] = checker
+    return checker
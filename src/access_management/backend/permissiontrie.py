@@ -0,0 +1,173 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+permissiontrie module
+Compiled matcher of permission path templates
+"""
+import threading
+from collections import OrderedDict
+
+MATCHER_CACHE_SIZE = 256
+
+NO_MATCH = 0
+METHOD_DENIED = 1
+ALLOWED = 2
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'wildcard', 'methods', 'domain_methods', 'path', 'domain_path')
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.methods = None
+        self.domain_methods = None
+        self.path = None
+        self.domain_path = None
+
+
+class PermissionTrie(object):
+    """
+    Trie of permission path segments
+    Literal segments are children of a node, <placeholder> segments share one wildcard child.
+    A permission path which has only one segment allows every endpoint of that domain.
+    """
+    def __init__(self, permissions):
+        """
+        Compiles the permissions of a user
+
+        :param permissions: dict where the keys are resource paths, values are the operations
+        """
+        self.root = _TrieNode()
+        for path, methods in permissions.iteritems():
+            self.add(path, methods)
+
+    def add(self, path, methods):
+        """
+        Adds a permission path template with its allowed methods
+
+        :param path: resource path, e.g. am/v1/users/<id>
+        :param methods: allowed operations of the path
+        """
+        segments = path.split("/")
+        node = self.root
+        for segment in segments:
+            if segment.startswith("<"):
+                if node.wildcard is None:
+                    node.wildcard = _TrieNode()
+                node = node.wildcard
+            else:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _TrieNode()
+                node = child
+        if node.methods is None:
+            node.methods = set()
+            node.path = path
+        node.methods.update(methods)
+        if len(segments) == 1:
+            if node.domain_methods is None:
+                node.domain_methods = set()
+                node.domain_path = path
+            node.domain_methods.update(methods)
+
+    def match(self, endpoint, method):
+        """
+        Looks up the most specific permission of the endpoint which allows the method
+        Literal segments are preferred to placeholders from left to right,
+        domain wide permissions are the least specific ones.
+
+        :param endpoint: endpoint of the request, e.g. am/v1/users/123
+        :param method: method of the request
+        :returns: tuple of the result (NO_MATCH, METHOD_DENIED or ALLOWED) and the matching path
+        :rtype: tuple(int, str)
+        """
+        segments = endpoint.split("/")
+        denied_path = None
+        for node in self._walk(self.root, segments, 0):
+            if method in node.methods:
+                return ALLOWED, node.path
+            if denied_path is None:
+                denied_path = node.path
+        domain_node = self.root.children.get(segments[0])
+        if domain_node is not None and domain_node.domain_methods is not None:
+            if method in domain_node.domain_methods:
+                return ALLOWED, domain_node.domain_path
+            if denied_path is None:
+                denied_path = domain_node.domain_path
+        if denied_path is not None:
+            return METHOD_DENIED, denied_path
+        return NO_MATCH, None
+
+    def _walk(self, node, segments, depth):
+        if depth == len(segments):
+            if node.methods is not None:
+                yield node
+            return
+        child = node.children.get(segments[depth])
+        if child is not None:
+            for found in self._walk(child, segments, depth + 1):
+                yield found
+        if node.wildcard is not None:
+            for found in self._walk(node.wildcard, segments, depth + 1):
+                yield found
+
+
+_matcher_cache = OrderedDict()
+_matcher_lock = threading.Lock()
+
+
+def find_matcher(key):
+    """
+    Returns the cached trie of a permission key
+
+    :param key: hashable value identifying the permission set, e.g. the RBAC version and role ids
+    :returns: compiled matcher, None if it is not cached
+    :rtype: PermissionTrie
+    """
+    if key is None:
+        return None
+    with _matcher_lock:
+        matcher = _matcher_cache.pop(key, None)
+        if matcher is not None:
+            _matcher_cache[key] = matcher
+        return matcher
+
+
+def get_matcher(key, permissions):
+    """
+    Compiles a permission set and caches the trie under its key
+
+    :param key: hashable value identifying the permission set, None disables the caching
+    :param permissions: dict where the keys are resource paths, values are the operations
+    :returns: compiled matcher
+    :rtype: PermissionTrie
+    """
+    matcher = PermissionTrie(permissions)
+    if key is None:
+        return matcher
+    with _matcher_lock:
+        _matcher_cache[key] = matcher
+        while len(_matcher_cache) > MATCHER_CACHE_SIZE:
+            _matcher_cache.popitem(last=False)
+    return matcher
+
+
+def clear_cache():
+    """
+    Drops the compiled tries
+    """
+    with _matcher_lock:
+        _matcher_cache.clear()
@@ -0,0 +1,181 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+rbacsnapshot module
+In-memory snapshot of the AM authorization tables
+"""
+import threading
+import time
+
+from access_management.backend.permissiontrie import PermissionTrie
+
+DEFAULT_PROBE_INTERVAL = 5
+DEFAULT_REFRESH_INTERVAL = 300
+
+
+class RBACSnapshot(object):
+    """
+    Immutable view of the RBAC graph
+    Users and roles are kept as int ids, each distinct path is stored once and the operations
+    a role has on a path are stored as a bitmask.
+    """
+    def __init__(self, version, tables):
+        """
+        Builds the snapshot
+
+        :param version: RBAC version the tables were read at
+        :param tables: rows returned by AMDatabase.get_rbac_tables
+        """
+        self.version = version
+        self.user_ids = dict((str(uuid), user_id) for user_id, uuid in tables['users'])
+        # names and paths may be non-ASCII unicode, they are not converted to str
+        self.role_names = dict((role_id, name) for role_id, name in tables['roles'])
+
+        self.methods = sorted(set(str(op) for res_id, path, op in tables['resources']))
+        method_bits = dict((method, 1 << index) for index, method in enumerate(self.methods))
+        paths = {}
+        resources = dict((res_id, (paths.setdefault(path, path), method_bits[str(op)]))
+                         for res_id, path, op in tables['resources'])
+
+        self.role_masks = {}
+        for role_id, res_id in tables['role_resources']:
+            path, bit = resources[res_id]
+            masks = self.role_masks.setdefault(role_id, {})
+            masks[path] = masks.get(path, 0) | bit
+
+        user_roles = {}
+        for user_id, role_id in tables['user_roles']:
+            user_roles.setdefault(user_id, set()).add(role_id)
+        self.user_roles = dict((user_id, tuple(sorted(role_ids))) for user_id, role_ids in user_roles.iteritems())
+
+        self.matchers = {}
+        self.matchers_lock = threading.Lock()
+
+    def has_user(self, user_uuid):
+        return user_uuid in self.user_ids
+
+    def get_user_roles(self, user_uuid):
+        """
+        :returns: role names of the user
+        :rtype: list[str]
+        """
+        role_ids = self.user_roles.get(self.user_ids[user_uuid], ())
+        return [self.role_names[role_id] for role_id in role_ids]
+
+    def get_user_resources(self, user_uuid):
+        """
+        :returns: dict where the keys are resource paths, values are the operations in a set
+        :rtype: dict[str:set[str]]
+        """
+        return self._resources_of_roles(self.user_roles.get(self.user_ids[user_uuid], ()))
+
+    def get_matcher(self, user_uuid):
+        """
+        Returns the compiled permissions of the user
+        Users having the same roles share one compiled trie.
+
+        :rtype: PermissionTrie
+        """
+        role_ids = self.user_roles.get(self.user_ids[user_uuid], ())
+        matcher = self.matchers.get(role_ids)
+        if matcher is None:
+            matcher = PermissionTrie(self._resources_of_roles(role_ids))
+            with self.matchers_lock:
+                self.matchers[role_ids] = matcher
+        return matcher
+
+    def _resources_of_roles(self, role_ids):
+        masks = {}
+        for role_id in role_ids:
+            for path, mask in self.role_masks.get(role_id, {}).iteritems():
+                masks[path] = masks.get(path, 0) | mask
+        return dict((path, set(method for index, method in enumerate(self.methods) if mask & (1 << index)))
+                    for path, mask in masks.iteritems())
+
+
+class RBACSnapshotManager(object):
+    """
+    Keeps the RBAC snapshot of the backend up to date
+    A background thread probes the RBAC version and rebuilds the snapshot when it changes
+    or when the refresh interval elapses. The new snapshot replaces the old one in one assignment.
+    """
+    def __init__(self, db, logger, probe_interval=DEFAULT_PROBE_INTERVAL,
+                 refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        """
+        :param db: AMDatabase instance
+        :param logger: logger instance to be used
+        :param probe_interval: seconds between two version probes
+        :param refresh_interval: maximum age of the snapshot in seconds, 0 means no forced refresh
+        """
+        self.db = db
+        self.logger = logger
+        self.probe_interval = probe_interval
+        self.refresh_interval = refresh_interval
+        self.current = None
+        self.loaded_at = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.refresh(force=True)
+        self.thread = threading.Thread(target=self._run, name="rbac-snapshot")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(self.probe_interval)
+
+    def _run(self):
+        while not self.stop_event.wait(self.probe_interval):
+            self.refresh()
+
+    def refresh(self, force=False):
+        """
+        Rebuilds the snapshot if the RBAC version changed or the snapshot is too old
+
+        :param force: rebuild without checking the version
+        :returns: True if the snapshot was rebuilt
+        """
+        try:
+            self.db.connect()
+        except Exception as error:
+            self.logger.error("Failed to refresh the RBAC snapshot: {}".format(str(error)))
+            self.failures += 1
+            return False
+        try:
+            version = self.db.get_rbac_version()
+            expired = self.refresh_interval and time.time() - self.loaded_at >= self.refresh_interval
+            if not force and not expired and self.current is not None and self.current.version == version:
+                return False
+            snapshot = RBACSnapshot(version, self.db.get_rbac_tables())
+        except Exception as error:
+            self.logger.error("Failed to refresh the RBAC snapshot: {}".format(str(error)))
+            self.failures += 1
+            return False
+        finally:
+            try:
+                self.db.close()
+            except Exception as error:
+                self.logger.error("Failure: {}".format(str(error)))
+        self.current = snapshot
+        self.loaded_at = time.time()
+        self.refreshes += 1
+        self.logger.info("RBAC snapshot loaded: {0} users, {1} roles".format(len(snapshot.user_ids),
+                                                                            len(snapshot.role_names)))
+        return True
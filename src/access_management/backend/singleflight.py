@@ -0,0 +1,100 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+singleflight module
+Coalesces concurrent identical calls into one
+"""
+import threading
+
+DEFAULT_TIMEOUT = 10
+
+
+class SingleFlightTimeout(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs only one call per key at a time
+    The first caller of a key becomes the leader and does the call,
+    the callers arriving while it runs wait for the leader's result.
+    """
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        """
+        :param timeout: seconds a follower waits for the leader
+        """
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, func, *args):
+        """
+        Calls func(*args) or waits for the running call of the same key
+
+        :param key: identifies identical calls
+        :param func: function to call
+        :returns: result of the call
+        :raise the exception of the call, SingleFlightTimeout if the leader did not finish in time
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if leader:
+            try:
+                call.result = func(*args)
+            except Exception as error:
+                call.error = error
+                raise
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.event.set()
+            return call.result
+
+        if not call.event.wait(self.timeout):
+            raise SingleFlightTimeout('Timed out waiting for the running call: {0}'.format(key))
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """
+        Returns the counters of the coalescing
+
+        :rtype: dict
+        """
+        with self.lock:
+            return {"leaders": self.leaders,
+                    "followers": self.followers,
+                    "in_flight": len(self.calls)}
@@ -0,0 +1,162 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+stagetimer module
+Latency histograms of the stages of an authorization
+"""
+import bisect
+import threading
+import time
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+KEYSTONE = "keystone"
+DB_CONNECT = "db_connect"
+DB_QUERY = "db_query"
+MATCH = "match"
+TOTAL = "total"
+STAGES = (KEYSTONE, DB_CONNECT, DB_QUERY, MATCH, TOTAL)
+
+
+class Histogram(object):
+    """
+    Thread safe latency histogram with fixed buckets
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def get(self):
+        """
+        Returns the cumulative bucket counts, the count and the sum of the observed values
+
+        :rtype: dict
+        """
+        with self.lock:
+            counts = list(self.counts)
+            ret = {"count": self.count, "sum": self.sum}
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        ret["buckets"] = buckets
+        return ret
+
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timers.record(self.name, time.time() - self.start)
+        return False
+
+
+class StageTimers(object):
+    """
+    Times the stages of the authorizations
+    The stages of the request running in the current thread are collected between begin() and end(),
+    then added to the per-stage histograms. When disabled, every call returns right away.
+    """
+    def __init__(self, enabled=False, slow_threshold=0, logger=None, histograms=None):
+        """
+        :param enabled: whether the stages are timed
+        :param slow_threshold: requests slower than this many seconds are logged with their stages, 0 disables it
+        :param logger: logger instance to be used
+        :param histograms: dict of the histograms of the stages, e.g. the ones of the metrics shared by the workers,
+                           histograms of this instance are used if not given
+        """
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.logger = logger
+        if histograms is None:
+            histograms = dict((stage, Histogram()) for stage in STAGES)
+        self.histograms = histograms
+        self.local = threading.local()
+
+    def begin(self):
+        if not self.enabled:
+            return
+        self.local.stages = []
+        self.local.start = time.time()
+
+    def stage(self, name):
+        """
+        Returns a context manager which times a stage
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, elapsed):
+        self.histograms[name].observe(elapsed)
+        stages = getattr(self.local, "stages", None)
+        if stages is not None:
+            stages.append((name, elapsed))
+
+    def end(self, description, *parts):
+        """
+        Closes the timing of the current request
+        The description is formatted only if the request is logged as slow.
+
+        :param description: format string describing the request in the slow request log
+        :param parts: arguments of the format string
+        """
+        if not self.enabled:
+            return
+        total = time.time() - self.local.start
+        self.histograms[TOTAL].observe(total)
+        stages, self.local.stages = self.local.stages, None
+        if self.slow_threshold and total >= self.slow_threshold and self.logger is not None:
+            self.logger.warning("Slow authorization ({0:.1f} ms) of {1}: {2}".format(
+                total * 1000, description.format(*parts).strip(),
+                ", ".join("{0}={1:.1f} ms".format(name, elapsed * 1000) for name, elapsed in stages)))
+
+    def get(self):
+        """
+        Returns the histograms of the stages, as observed by this process
+
+        :rtype: dict
+        """
+        return dict((stage, histogram.get()) for stage, histogram in self.histograms.iteritems())
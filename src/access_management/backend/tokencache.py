@@ -0,0 +1,133 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+tokencache module
+Cache of validated keystone tokens
+"""
+import calendar
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 60
+DEFAULT_SIZE = 1024
+
+
+class TokenCache(object):
+    """
+    LRU cache of validated tokens
+    Entries are keyed by the hash of the token and expire at the earlier of the TTL
+    and the expiry of the token itself.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_SIZE):
+        """
+        Creates the cache
+
+        :param ttl: maximum lifetime of an entry in seconds, 0 disables the cache
+        :param max_size: maximum number of entries
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def token_key(token):
+        # the token of a JSON request is unicode, hashlib only takes bytes
+        if isinstance(token, unicode):
+            token = token.encode("utf-8")
+        return hashlib.sha256(token).hexdigest()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, token):
+        """
+        Looks up a token
+
+        :param token: keystone token
+        :returns: tuple of user_id and username, None if the token is not cached
+        :rtype: tuple(str, str)
+        """
+        if not self.enabled:
+            return None
+        key = self.token_key(token)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, token, user_id, username, expires=None):
+        """
+        Stores a validated token
+
+        :param token: keystone token
+        :param user_id: id of the token's owner
+        :param username: name of the token's owner
+        :param expires: expiry of the token as a datetime, None if unknown
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        if expires is not None:
+            expires_at = min(expires_at, calendar.timegm(expires.utctimetuple()))
+        if expires_at <= now:
+            return
+        key = self.token_key(token)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (expires_at, user_id, username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token):
+        with self.lock:
+            self.entries.pop(self.token_key(token), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Returns the counters of the cache
+
+        :rtype: dict
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self.entries),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "expirations": self.expirations,
+                    "hit_rate": float(self.hits) / lookups if lookups else 0.0}
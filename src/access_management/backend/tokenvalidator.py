@@ -0,0 +1,121 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+tokenvalidator module
+Validates keystone tokens with the service credentials of AM
+"""
+import threading
+
+from keystoneauth1 import access
+from keystoneauth1 import exceptions
+from keystoneauth1 import session
+from keystoneauth1.identity import v3
+
+import access_management.config.defaults as defaults
+
+SERVICE_MODE = "service"
+USER_MODE = "user"
+
+
+class WrongProjectScope(exceptions.http.NotFound):
+    """
+    The token is valid, but it is not scoped to the project AM authorizes for
+    It is handled like an unknown token.
+    """
+
+
+class ServiceTokenValidator(object):
+    """
+    Validates tokens through one long-lived session of the AM service user
+    keystoneauth authenticates the session once and again only when its token is about to expire.
+    """
+    def __init__(self, auth_uri, username, password, project_name=defaults.PROJECT_NAME,
+                 token_project_name=defaults.PROJECT_NAME, token_project_id=None):
+        """
+        Creates the service session
+
+        :param auth_uri: keystone v3 endpoint
+        :param username: name of the service user
+        :param password: password of the service user
+        :param project_name: project the service token is scoped to
+        :param token_project_name: project of the default domain the validated tokens must be scoped to
+        :param token_project_id: id of the project the validated tokens must be scoped to, checked instead
+                                 of the name if given
+        """
+        self.url = auth_uri.rstrip("/") + "/auth/tokens"
+        self.token_project_name = token_project_name
+        self.token_project_id = token_project_id
+        auth = v3.Password(auth_url=auth_uri,
+                           username=username,
+                           password=password,
+                           project_name=project_name,
+                           user_domain_id="default",
+                           project_domain_id="default")
+        self.session = session.Session(auth=auth)
+        self.auth_lock = threading.Lock()
+
+    def validate(self, token):
+        """
+        Validates a token with X-Subject-Token
+        Like the user mode, which rescopes the token to the infrastructure project, only tokens
+        of that project are accepted.
+
+        :param token: keystone token to validate
+        :returns: information about the token
+        :rtype: keystoneauth1.access.AccessInfo
+        :raise keystoneauth1.exceptions.http.NotFound if the token is not valid,
+               WrongProjectScope if it is not scoped to the project
+        """
+        with self.auth_lock:
+            # one thread authenticates, the others reuse its token
+            self.session.get_token()
+        response = self.session.get(self.url, headers={"X-Subject-Token": token})
+        auth_ref = access.create(resp=response, body=response.json())
+        self.check_scope(auth_ref)
+        return auth_ref
+
+    def check_scope(self, auth_ref):
+        """
+        :raise WrongProjectScope if the token is not scoped to the configured project
+        """
+        if self.token_project_id is not None:
+            scoped = auth_ref.project_id == self.token_project_id
+        else:
+            scoped = auth_ref.project_name == self.token_project_name and auth_ref.project_domain_id == "default"
+        if not scoped:
+            raise WrongProjectScope(message="The token is scoped to the {0} project instead of {1}".format(
+                auth_ref.project_name, self.token_project_id or self.token_project_name))
+
+    def close(self):
+        self.session.session.close()
+
+
+def create_validator(config):
+    """
+    Creates the validator configured in the Keystone section of the config
+
+    :param config: parsed config
+    :returns: service validator or None if tokens are validated with their own scoped session
+    :rtype: ServiceTokenValidator
+    """
+    keystone_config = config["Keystone"]
+    if keystone_config.get("token_validation", USER_MODE) != SERVICE_MODE:
+        return None
+    return ServiceTokenValidator(auth_uri=keystone_config["auth_uri"],
+                                 username=keystone_config["service_username"],
+                                 password=keystone_config["service_password"],
+                                 project_name=keystone_config.get("service_project", defaults.PROJECT_NAME),
+                                 token_project_name=keystone_config.get("token_project", defaults.PROJECT_NAME),
+                                 token_project_id=keystone_config.get("token_project_id"))
@@ -0,0 +1,125 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+wsgiserver module
+Serves the auth-server app with pre-forked gunicorn workers
+"""
+import glob
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+import access_management.backend.authserver as authserver
+import access_management.backend.metrics as metricsmod
+import access_management.backend.restlogger as restlog
+from access_management.config.amconfigparser import AMConfigParser
+
+DEFAULT_WORKERS = 4
+DEFAULT_THREADS = 4
+DEFAULT_BACKLOG = 2048
+DEFAULT_KEEPALIVE = 5
+# RuntimeDirectory of the auth-server unit, removed by systemd when the service stops
+DEFAULT_METRICS_DIR = "/run/auth-server/metrics"
+
+
+class AuthServerApplication(BaseApplication):
+    """
+    Gunicorn application of the auth-server
+    Every worker runs the same initialize() wiring as the development server after it is forked.
+    The configuration file is parsed again on SIGHUP, before the workers are replaced.
+    """
+    def __init__(self, config_file=authserver.CONFIG_FILE):
+        self.config_file = config_file
+        self.config = None
+        super(AuthServerApplication, self).__init__()
+
+    def load_config(self):
+        try:
+            config = AMConfigParser(self.config_file).parse()
+            prepare_metrics_dir(config)
+        except Exception as error:
+            if self.config is None:
+                raise
+            # a failing reload would stop the master, the workers keep the previous configuration
+            print >> sys.stderr, "Failed to reload {0}: {1}".format(self.config_file, error)
+        else:
+            self.config = config
+        api_config = self.config["Api"]
+        self.cfg.set("bind", "{0}:{1}".format(api_config["host"], api_config["port"]))
+        self.cfg.set("workers", int(api_config.get("workers", DEFAULT_WORKERS)))
+        self.cfg.set("threads", int(api_config.get("threads", DEFAULT_THREADS)))
+        self.cfg.set("backlog", int(api_config.get("backlog", DEFAULT_BACKLOG)))
+        self.cfg.set("keepalive", int(api_config.get("keepalive", DEFAULT_KEEPALIVE)))
+        self.cfg.set("post_worker_init", post_worker_init)
+        self.cfg.set("worker_exit", worker_exit)
+        self.cfg.set("child_exit", child_exit)
+
+    def load(self):
+        return authserver.app
+
+
+def post_worker_init(worker):
+    config = worker.app.config
+    authserver.config = config
+    authserver.initialize(config, restlog.get_logger(config))
+
+
+def worker_exit(server, worker):
+    authserver.shutdown()
+
+
+def child_exit(server, worker):
+    """
+    Folds the metrics of the exited worker into the totals, also when it was killed
+    Runs in the master after the worker is reaped.
+    """
+    metricsmod.retire_process(server.app.config["Api"]["metrics_dir"], worker.pid, server.log)
+
+
+def prepare_metrics_dir(config):
+    """
+    Creates the directory the workers share their metrics in
+    DEFAULT_METRICS_DIR is used if none is configured.
+
+    :returns: path of the directory
+    :rtype: str
+    """
+    metrics_dir = config["Api"].setdefault("metrics_dir", DEFAULT_METRICS_DIR)
+    if not os.path.isdir(metrics_dir):
+        os.makedirs(metrics_dir)
+    return metrics_dir
+
+
+def clear_metrics_dir(metrics_dir):
+    """
+    Removes the metrics files of a previous run
+    """
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        os.remove(path)
+
+
+def main():
+    application = AuthServerApplication()
+    clear_metrics_dir(application.config["Api"]["metrics_dir"])
+    application.run()
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except Exception as error:# pylint: disable=broad-except
+        print "Failure: %s" % error
+        sys.exit(255)
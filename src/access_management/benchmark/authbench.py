@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+authbench module
+Measures the authorization throughput of AMBackend and the auth-server app
+against a fake Keystone and an SQLite or local MySQL database
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import access_management.backend.authserver as authserver
+import access_management.backend.permissiontrie as permissiontrie
+import access_management.backend.restlogger as restlog
+import access_management.benchmark.fakekeystone as fakekeystone
+import access_management.benchmark.standin as standin
+from access_management.db.amdb import AlreadyExist
+
+TARGETS = ("backend", "http")
+WORKLOADS = ("cold", "warm", "mixed")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    """
+    :param latencies: latencies of the operations in seconds
+    :param elapsed: wall clock time of the run in seconds
+    :returns: ops/sec and the p50, p95 and p99 latencies in milliseconds
+    :rtype: dict
+    """
+    latencies = sorted(latencies)
+    return {"ops": len(latencies),
+            "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000}
+
+
+class Benchmark(object):
+    """
+    Runs the workloads against one target
+    """
+    def __init__(self, config, dataset, target, threads=1, write_ratio=0.1):
+        """
+        :param config: auth-server config pointing to the stand-ins
+        :param dataset: standin.Dataset the database is seeded with
+        :param target: "backend" calls AMBackend.is_authorized, "http" posts to the Flask test client
+        :param threads: number of concurrent clients
+        :param write_ratio: share of RBAC changes in the mixed workload
+        """
+        self.config = config
+        self.dataset = dataset
+        self.target = target
+        self.threads = threads
+        self.write_ratio = write_ratio
+        self.local = threading.local()
+
+    def authorize(self, request):
+        user_uuid, domain, domain_object, method = request
+        token = fakekeystone.token_of(user_uuid)
+        if self.target == "backend":
+            return authserver.get_backend().is_authorized(token=token, domain=domain, domain_object=domain_object,
+                                                          method=method)
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = authserver.app.test_client()
+        params = {"token": token, "domain": domain, "domain_object": domain_object, "method": method}
+        body = json.dumps({"method": "post", "params": json.dumps(params), "id": 0})
+        response = client.post("/authorize/endpoint", data=body, content_type="application/json")
+        if response.status_code != 200:
+            raise Exception("Unexpected status: {0}".format(response.status_code))
+        return json.loads(response.data)
+
+    def change_rbac(self, rng):
+        """
+        Adds a random role to a random user, or removes it if the user already has it
+        The connection is closed right away as the backend uses the same thread local connection.
+        """
+        uuid = self.dataset.user_uuid(rng.randrange(self.dataset.users))
+        role_name = self.dataset.role_name(rng.randrange(self.dataset.roles))
+        db = standin.open_db(self.config["DB"])
+        try:
+            db.add_user_role(uuid, role_name)
+        except AlreadyExist:
+            db.delete_user_role(uuid, role_name)
+        finally:
+            db.close()
+
+    def clear_caches(self):
+        backend = authserver.get_backend()
+        backend.token_cache.clear()
+        permissiontrie.clear_cache()
+
+    def run(self, workload, count):
+        """
+        Runs a workload
+
+        :param workload: "cold" clears the caches before every request, "warm" runs after a warm-up,
+                         "mixed" interleaves RBAC changes with the requests
+        :param count: number of operations
+        :returns: summary per operation kind
+        :rtype: dict
+        """
+        requests = self.dataset.requests(count)
+        if workload == "warm":
+            for request in self.dataset.requests(count):
+                self.authorize(request)
+
+        latencies = {"read": [], "write": []}
+        errors = []
+        lock = threading.Lock()
+        per_thread = [requests[index::self.threads] for index in range(self.threads)]
+
+        def client(thread_index):
+            rng = random.Random(thread_index)
+            reads, writes = [], []
+            try:
+                for request in per_thread[thread_index]:
+                    write = workload == "mixed" and rng.random() < self.write_ratio
+                    if workload == "cold":
+                        self.clear_caches()
+                    start = time.time()
+                    if write:
+                        self.change_rbac(rng)
+                        writes.append(time.time() - start)
+                    else:
+                        self.authorize(request)
+                        reads.append(time.time() - start)
+            except Exception:
+                # re-raised after the join, partial numbers are not reported
+                with lock:
+                    errors.append(sys.exc_info())
+                return
+            with lock:
+                latencies["read"].extend(reads)
+                latencies["write"].extend(writes)
+
+        clients = [threading.Thread(target=client, args=(index,)) for index in range(self.threads)]
+        start = time.time()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.time() - start
+        if errors:
+            exc_type, exc_value, exc_traceback = errors[0]
+            raise exc_type, exc_value, exc_traceback
+
+        ret = {"read": summarize(latencies["read"], elapsed)}
+        if latencies["write"]:
+            ret["write"] = summarize(latencies["write"], elapsed)
+        return ret
+
+
+def make_config(db_config, auth_uri, logdir, token_validation, snapshot):
+    config = {"DB": dict(db_config),
+              "Logging": {"loglevel": "CRITICAL", "logdir": logdir},
+              "Keystone": {"auth_uri": auth_uri, "token_validation": token_validation,
+                           "service_username": "am-bench", "service_password": "am-bench"},
+              "Api": {"host": "127.0.0.1", "port": "0"}}
+    config["DB"]["rbac_snapshot"] = "true" if snapshot else "false"
+    return config
+
+
+def run(args):
+    """
+    Sets up the stand-ins and runs every target and workload
+
+    :returns: results keyed by target and workload
+    :rtype: dict
+    """
+    workdir = tempfile.mkdtemp(prefix="authbench-")
+    keystone = fakekeystone.FakeKeystone(latency=args.keystone_latency / 1000.0)
+    keystone.start()
+    try:
+        if args.db == "sqlite":
+            db_config = standin.use_sqlite(os.path.join(workdir, "am.db"))
+        else:
+            db_config = standin.mysql_config(args.db_name, args.db_addr, args.db_port, args.db_user, args.db_pwd,
+                                             args.db_pool_size)
+        dataset = standin.Dataset(users=args.users, roles=args.roles, resources=args.resources,
+                                  permissions=args.permissions, roles_per_user=args.roles_per_user, skew=args.skew,
+                                  seed=args.seed)
+        db = standin.open_db(db_config)
+        try:
+            dataset.seed_db(db)
+        finally:
+            db.close()
+
+        config = make_config(db_config, keystone.auth_uri, workdir, args.token_validation, args.snapshot)
+        authserver.config = config
+        authserver.initialize(config, restlog.get_logger(config))
+        results = {}
+        try:
+            for target in args.targets:
+                for workload in args.workloads:
+                    bench = Benchmark(config, dataset, target, threads=args.threads, write_ratio=args.write_ratio)
+                    results.setdefault(target, {})[workload] = bench.run(workload, args.requests)
+        finally:
+            authserver.shutdown()
+        results["keystone_requests"] = keystone.requests
+        return results
+    finally:
+        keystone.stop()
+        shutil.rmtree(workdir)
+
+
+def print_results(results, targets, workloads):
+    print "{0:8} {1:8} {2:6} {3:>8} {4:>12} {5:>9} {6:>9} {7:>9}".format(
+        "target", "workload", "kind", "ops", "ops/sec", "p50 ms", "p95 ms", "p99 ms")
+    for target in targets:
+        for workload in workloads:
+            for kind in ("read", "write"):
+                summary = results[target][workload].get(kind)
+                if summary is None:
+                    continue
+                print "{0:8} {1:8} {2:6} {3:8d} {4:12.1f} {5:9.3f} {6:9.3f} {7:9.3f}".format(
+                    target, workload, kind, summary["ops"], summary["ops_per_sec"], summary["p50_ms"],
+                    summary["p95_ms"], summary["p99_ms"])
+    print "Keystone requests: {0}".format(results["keystone_requests"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authorization benchmark of the auth-server")
+    parser.add_argument("--requests", type=int, default=2000, help="Operations per target and workload")
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent clients")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="Share of RBAC changes in the mixed workload")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--roles", type=int, default=10)
+    parser.add_argument("--resources", type=int, default=50)
+    parser.add_argument("--permissions", type=int, default=20, help="Permissions per role")
+    parser.add_argument("--roles-per-user", type=int, default=2)
+    parser.add_argument("--skew", type=float, default=1.0, help="Exponent of the Zipf-like role popularity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--snapshot", action="store_true", help="Serve the authorizations from the RBAC snapshot")
+    parser.add_argument("--token-validation", choices=("user", "service"), default="user")
+    parser.add_argument("--keystone-latency", type=float, default=0.0, help="Added Keystone latency in ms")
+    parser.add_argument("--db", choices=("sqlite", "mysql"), default="sqlite")
+    parser.add_argument("--db-name", default="am_bench")
+    parser.add_argument("--db-addr", default="127.0.0.1")
+    parser.add_argument("--db-port", type=int, default=3306)
+    parser.add_argument("--db-user", default="root")
+    parser.add_argument("--db-pwd", default="")
+    parser.add_argument("--db-pool-size", type=int, default=0)
+    parser.add_argument("--json", help="Writes the results into this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    results = run(args)
+    print_results(results, args.targets, args.workloads)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+backendreuse module
+Compares building an AMBackend for each request with reusing the worker's backend
+"""
+import argparse
+import gc
+import shutil
+import tempfile
+import timeit
+
+import access_management.backend.authserver as authserver
+from access_management.backend.ambackend import AMBackend
+
+
+def make_config(logdir):
+    return {"DB": {"name": "am_database", "addr": "127.0.0.1", "port": "3306", "user": "am", "pwd": "am"},
+            "Logging": {"loglevel": "ERROR", "logdir": logdir},
+            "Keystone": {"auth_uri": "http://127.0.0.1:5000/v3"},
+            "Api": {"host": "127.0.0.1", "port": "61100"}}
+
+
+def count_allocations(func, rounds):
+    """
+    Counts the objects kept alive by the results of func
+
+    :returns: number of new gc tracked objects per call
+    :rtype: float
+    """
+    gc.collect()
+    before = len(gc.get_objects())
+    results = [func() for _ in range(rounds)]
+    gc.collect()
+    after = len(gc.get_objects())
+    del results
+    return float(after - before) / rounds
+
+
+def run(rounds):
+    logdir = tempfile.mkdtemp()
+    try:
+        config = make_config(logdir)
+        authserver.config = config
+        authserver.startup(config)
+
+        per_request = lambda: AMBackend(config)
+        reused = authserver.get_backend
+
+        results = {}
+        for name, func in (("per-request", per_request), ("reused", reused)):
+            seconds = min(timeit.repeat(func, number=rounds, repeat=3))
+            results[name] = {"usec_per_call": seconds * 1000000.0 / rounds,
+                             "objects_per_call": count_allocations(func, rounds)}
+        authserver.shutdown()
+        return results
+    finally:
+        shutil.rmtree(logdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the AMBackend reuse in the auth-server")
+    parser.add_argument("--rounds", type=int, default=10000, help="Number of simulated requests")
+    args = parser.parse_args()
+    results = run(args.rounds)
+    for name in ("per-request", "reused"):
+        print "{0:12} {1:10.2f} usec/call {2:10.2f} objects/call".format(name, results[name]["usec_per_call"],
+                                                                      results[name]["objects_per_call"])
+    saved = results["per-request"]["usec_per_call"] - results["reused"]["usec_per_call"]
+    print "Saved per request: {0:.2f} usec".format(saved)
+
+
+if __name__ == '__main__':
+    main()
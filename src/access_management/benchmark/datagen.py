@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+datagen module
+Bulk loads a large synthetic RBAC dataset into an empty AM database
+"""
+import argparse
+import time
+
+import access_management.benchmark.standin as standin
+from access_management.db.amdb import AMdbUser, AMdbRole, AMdbResource, AMdbUserRole, AMdbRoleResource
+from access_management.db.amdb import DEFAULT_BATCH_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic RBAC dataset into an empty AM database")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--roles", type=int, default=2000)
+    parser.add_argument("--resources", type=int, default=10000, help="Resource paths, each with GET, POST and DELETE")
+    parser.add_argument("--permissions", type=int, default=50, help="Permissions per role")
+    parser.add_argument("--roles-per-user", type=int, default=3, help="Average number of roles per user")
+    parser.add_argument("--skew", type=float, default=1.0, help="Exponent of the Zipf-like role popularity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per INSERT")
+    parser.add_argument("--db", choices=("sqlite", "mysql"), default="sqlite")
+    parser.add_argument("--sqlite-path", default="am_dataset.db")
+    parser.add_argument("--db-name", default="am_bench")
+    parser.add_argument("--db-addr", default="127.0.0.1")
+    parser.add_argument("--db-port", type=int, default=3306)
+    parser.add_argument("--db-user", default="root")
+    parser.add_argument("--db-pwd", default="")
+    args = parser.parse_args()
+
+    if args.db == "sqlite":
+        db_config = standin.use_sqlite(args.sqlite_path)
+    else:
+        db_config = standin.mysql_config(args.db_name, args.db_addr, args.db_port, args.db_user, args.db_pwd)
+    dataset = standin.Dataset(users=args.users, roles=args.roles, resources=args.resources,
+                              permissions=args.permissions, roles_per_user=args.roles_per_user, skew=args.skew,
+                              seed=args.seed)
+    db = standin.open_db(db_config)
+    try:
+        start = time.time()
+        if not dataset.seed_db(db, args.batch_size):
+            print "The dataset is already loaded"
+            return
+        elapsed = time.time() - start
+        counts = [(model._meta.db_table, model.select().count())
+                  for model in (AMdbUser, AMdbRole, AMdbResource, AMdbUserRole, AMdbRoleResource)]
+    finally:
+        db.close()
+    for table, count in counts:
+        print "{0:15} {1:10d} rows".format(table, count)
+    rows = sum(count for _, count in counts)
+    print "Loaded {0} rows in {1:.1f} s ({2:.0f} rows/s)".format(rows, elapsed, rows / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+fakekeystone module
+Local stand-in of the Keystone token API for the benchmarks
+"""
+import BaseHTTPServer
+import SocketServer
+import datetime
+import json
+import threading
+import time
+
+import access_management.config.defaults as defaults
+
+TOKEN_PREFIX = "tok-"
+SERVICE_TOKEN = "service-token"
+
+
+def token_of(user_uuid):
+    """
+    Returns the token the fake Keystone accepts for a user
+    """
+    return TOKEN_PREFIX + user_uuid
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.keystone.handle_request()
+        if self.path.rstrip("/").endswith("/auth/tokens"):
+            token = self.headers.getheader("X-Subject-Token", "")
+            if not token.startswith(TOKEN_PREFIX):
+                self._send(404, {"error": {"code": 404, "message": "Could not find token", "title": "Not Found"}})
+                return
+            self._send(200, self.server.keystone.token_body(token[len(TOKEN_PREFIX):]), token)
+            return
+        self._send(200, self.server.keystone.version_body())
+
+    def do_POST(self):
+        self.server.keystone.handle_request()
+        length = int(self.headers.getheader("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or "{}")
+        identity = body.get("auth", {}).get("identity", {})
+        if "token" in identity.get("methods", []):
+            token = identity["token"]["id"]
+            if not token.startswith(TOKEN_PREFIX):
+                self._send(401, {"error": {"code": 401, "message": "Invalid token", "title": "Unauthorized"}})
+                return
+            user_uuid = token[len(TOKEN_PREFIX):]
+        else:
+            user_uuid = identity.get("password", {}).get("user", {}).get("name", "service")
+            token = SERVICE_TOKEN
+        self._send(201, self.server.keystone.token_body(user_uuid), token)
+
+    def _send(self, status, body, token=None):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if token is not None:
+            self.send_header("X-Subject-Token", token)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeKeystone(object):
+    """
+    Minimal Keystone v3 serving token issuing and validation
+    Tokens are "tok-<user uuid>", every such token is valid and belongs to the user in it.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        """
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free one
+        :param latency: seconds added to every response
+        """
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = _ThreadingHTTPServer((host, port), _Handler)
+        self.server.keystone = self
+        self.thread = None
+
+    @property
+    def auth_uri(self):
+        host, port = self.server.server_address
+        return "http://{0}:{1}/v3".format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-keystone")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle_request(self):
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def version_body(self):
+        return {"version": {"id": "v3.10", "status": "stable",
+                            "links": [{"rel": "self", "href": self.auth_uri + "/"}]}}
+
+    def token_body(self, user_uuid):
+        now = datetime.datetime.utcnow()
+        domain = {"id": "default", "name": "Default"}
+        endpoints = [{"id": interface, "interface": interface, "region": "RegionOne", "region_id": "RegionOne",
+                      "url": self.auth_uri} for interface in ("public", "internal", "admin")]
+        return {"token": {"methods": ["password"],
+                          "issued_at": now.strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+                          "expires_at": (now + datetime.timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+                          "user": {"id": user_uuid, "name": user_uuid, "domain": domain},
+                          "project": {"id": defaults.PROJECT_NAME, "name": defaults.PROJECT_NAME, "domain": domain},
+                          "roles": [{"id": "admin", "name": "admin"}],
+                          "catalog": [{"id": "identity", "type": "identity", "name": "keystone",
+                                       "endpoints": endpoints}]}}
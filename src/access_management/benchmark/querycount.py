@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+querycount module
+Regression check of the number of DB queries on the authorization path
+Exits with 1 if a step runs more queries than its budget.
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+
+import access_management.backend.authserver as authserver
+import access_management.backend.permissiontrie as permissiontrie
+import access_management.backend.restlogger as restlog
+import access_management.benchmark.fakekeystone as fakekeystone
+import access_management.benchmark.standin as standin
+import access_management.db.amdb as amdb
+from access_management.benchmark.authbench import make_config
+
+# maximum number of queries of each step
+BUDGETS = (("get_user_resources", 1),
+           ("is_authorized cold", 2),
+           ("is_authorized warm", 1),
+           ("is_authorized_batch warm", 3))
+
+
+class QueryCounter(object):
+    """
+    Counts the statements run through execute_sql of a database
+    """
+    def __init__(self, database):
+        self.database = database
+        self.count = 0
+        self.execute_sql = database.execute_sql
+        database.execute_sql = self._execute_sql
+
+    def _execute_sql(self, *args, **kwargs):
+        self.count += 1
+        return self.execute_sql(*args, **kwargs)
+
+    def measure(self, func):
+        """
+        :returns: number of statements func ran
+        :rtype: int
+        """
+        start = self.count
+        func()
+        return self.count - start
+
+
+def run():
+    """
+    Runs every step against an SQLite stand-in and a fake Keystone
+
+    :returns: list of (step, queries, budget) tuples
+    :rtype: list[tuple]
+    """
+    workdir = tempfile.mkdtemp(prefix="querycount-")
+    keystone = fakekeystone.FakeKeystone()
+    keystone.start()
+    try:
+        db_config = standin.use_sqlite(workdir + "/am.db")
+        dataset = standin.Dataset(users=10, roles=4, resources=10, permissions=10)
+        db = standin.open_db(db_config)
+        try:
+            dataset.seed_db(db)
+            # the version row is created by the first RBAC change
+            db.add_user_role(dataset.user_uuid(0), dataset.role_name(3))
+        except amdb.AlreadyExist:
+            pass
+        finally:
+            db.close()
+
+        config = make_config(db_config, keystone.auth_uri, workdir, "user", False)
+        authserver.config = config
+        authserver.initialize(config, restlog.get_logger(config))
+        try:
+            backend = authserver.get_backend()
+            counter = QueryCounter(amdb.DIRECT_DB)
+            user_uuid = dataset.user_uuid(0)
+            token = fakekeystone.token_of(user_uuid)
+            domain, domain_object = dataset.resource_path(0).replace("<id>", "1").split("/", 1)
+            endpoint = {"domain": domain, "domain_object": domain_object, "method": "GET"}
+
+            def get_user_resources():
+                backend.db.connect()
+                try:
+                    backend.db.get_user_resources(user_uuid)
+                finally:
+                    backend.db.close()
+
+            def authorize_cold():
+                backend.token_cache.clear()
+                permissiontrie.clear_cache()
+                backend.is_authorized(token=token, **endpoint)
+
+            def authorize_warm():
+                backend.is_authorized(token=token, **endpoint)
+
+            def authorize_batch():
+                backend.is_authorized_batch(token, [endpoint, endpoint], [dataset.role_name(0)])
+
+            steps = (get_user_resources, authorize_cold, authorize_warm, authorize_batch)
+            return [(name, counter.measure(step), budget) for (name, budget), step in zip(BUDGETS, steps)]
+        finally:
+            authserver.shutdown()
+    finally:
+        keystone.stop()
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the number of DB queries of the authorization path")
+    parser.parse_args()
+    failed = False
+    for name, queries, budget in run():
+        status = "OK" if queries <= budget else "OVER BUDGET"
+        failed = failed or queries > budget
+        print "{0:26} {1:3d} queries, budget {2:3d}  {3}".format(name, queries, budget, status)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+standin module
+Database stand-ins and the RBAC data the benchmarks run against
+"""
+import bisect
+import logging
+import random
+
+from peewee import SqliteDatabase
+
+import access_management.db.amdb as amdb
+from access_management.db.amdb import AMdbUser, AMdbRole, AMdbResource, AMdbUserRole, AMdbRoleResource
+
+USER_PREFIX = "bench-user-"
+ROLE_PREFIX = "bench-role-"
+RESOURCE_PATH = "bench/v1/objects{0}/<id>"
+METHODS = ("GET", "POST", "DELETE")
+# SQLite allows 999 bound parameters in a statement before 3.32
+SQLITE_MAX_VARIABLES = 999
+# seconds a connection waits for the write lock of another one
+SQLITE_BUSY_TIMEOUT = 30
+
+
+class SqliteStandIn(SqliteDatabase):
+    """
+    SQLite database in place of the MySQL server of AMDatabase
+    The MySQL connection parameters AMDatabase.connect passes are ignored.
+    Transactions take the write lock when they begin. A deferred transaction reading before it writes
+    fails with "database is locked" without waiting if another connection wrote in the meantime.
+    """
+    def __init__(self, path):
+        super(SqliteStandIn, self).__init__(path, pragmas=[("journal_mode", "wal")], check_same_thread=False,
+                                            timeout=SQLITE_BUSY_TIMEOUT)
+
+    def begin(self, lock_type=None):
+        super(SqliteStandIn, self).begin(lock_type or "IMMEDIATE")
+
+    def init(self, database, **connect_kwargs):
+        if getattr(self, "database", None) is None:
+            super(SqliteStandIn, self).init(database, **connect_kwargs)
+
+
+def use_sqlite(path):
+    """
+    Makes every AMDatabase of the process use an SQLite file
+
+    :param path: path of the SQLite file
+    :returns: DB section of the config to be used with the stand-in
+    :rtype: dict
+    """
+    amdb.DIRECT_DB = SqliteStandIn(path)
+    return {"name": path, "addr": "127.0.0.1", "port": "0", "user": "", "pwd": "", "pool_max_connections": "0"}
+
+
+def mysql_config(name, addr, port, user, pwd, pool_size=0):
+    """
+    Returns the DB section of the config of a local MySQL server
+    """
+    return {"name": name, "addr": addr, "port": str(port), "user": user, "pwd": pwd,
+            "pool_max_connections": str(pool_size)}
+
+
+def open_db(db_config, logger=None):
+    """
+    Connects to the benchmark database in management mode
+
+    :param db_config: DB section of the config
+    :rtype: AMDatabase
+    """
+    db = amdb.AMDatabase(db_name=db_config["name"], db_addr=db_config["addr"], db_port=int(db_config["port"]),
+                         db_user=db_config["user"], db_pwd=db_config["pwd"],
+                         logger=logger or logging.getLogger("benchmark"), management_mode=True)
+    db.connect()
+    return db
+
+
+class Dataset(object):
+    """
+    Describes the benchmark users, roles and permissions
+    The same parameters and seed always give the same data.
+    Role membership is skewed: the popularity of the role of rank r is proportional to 1 / (r + 1) ** skew.
+    """
+    def __init__(self, users=100, roles=10, resources=50, permissions=20, roles_per_user=2, skew=1.0, seed=0):
+        """
+        :param users: number of users
+        :param roles: number of roles
+        :param resources: number of resource paths, each with every method of METHODS
+        :param permissions: number of resource and method pairs per role
+        :param roles_per_user: average number of roles per user
+        :param skew: exponent of the role popularity, 0 makes every role equally popular
+        :param seed: seed of the random choices
+        """
+        self.users = users
+        self.roles = roles
+        self.resources = resources
+        self.permissions = min(permissions, resources * len(METHODS))
+        self.roles_per_user = min(roles_per_user, roles)
+        self.skew = skew
+        self.seed = seed
+
+    def user_uuid(self, index):
+        return "{0}{1:06d}".format(USER_PREFIX, index)
+
+    def role_name(self, index):
+        return "{0}{1:04d}".format(ROLE_PREFIX, index)
+
+    def resource_path(self, index):
+        return RESOURCE_PATH.format(index)
+
+    def resource_rows(self):
+        """
+        :returns: list of (resource path, method) tuples, the index in the list is the resource id - 1
+        """
+        return [(self.resource_path(resource), method) for resource in range(self.resources) for method in METHODS]
+
+    def role_resource_ids(self):
+        """
+        :returns: list of (role index, resource index) tuples of the permissions
+        """
+        rng = random.Random(self.seed)
+        pairs = range(self.resources * len(METHODS))
+        ret = []
+        for role in range(self.roles):
+            ret.extend((role, resource) for resource in rng.sample(pairs, self.permissions))
+        return ret
+
+    def user_role_ids(self):
+        """
+        :returns: list of (user index, role index) tuples of the skewed role membership
+        """
+        rng = random.Random(self.seed + 1)
+        cumulative = []
+        total = 0.0
+        for rank in range(self.roles):
+            total += 1.0 / (rank + 1) ** self.skew
+            cumulative.append(total)
+        ret = []
+        for user in range(self.users):
+            count = min(self.roles, rng.randint(1, 2 * self.roles_per_user - 1)) if self.roles_per_user else 0
+            chosen = set()
+            attempts = 0
+            while len(chosen) < count and attempts < 100 * count:
+                chosen.add(min(self.roles - 1, bisect.bisect(cumulative, rng.random() * total)))
+                attempts += 1
+            if len(chosen) < count:
+                chosen.update(rng.sample([role for role in range(self.roles) if role not in chosen],
+                                         count - len(chosen)))
+            ret.extend((user, role) for role in sorted(chosen))
+        return ret
+
+    def requests(self, count, seed=None):
+        """
+        Returns random authorization requests, some of them allowed, some denied
+
+        :returns: list of (user uuid, domain, domain object, method) tuples
+        """
+        rng = random.Random(self.seed + 2 if seed is None else seed)
+        ret = []
+        for _ in range(count):
+            path = self.resource_path(rng.randrange(self.resources)).replace("<id>", str(rng.randrange(1000)))
+            domain, domain_object = path.split("/", 1)
+            ret.append((self.user_uuid(rng.randrange(self.users)), domain, domain_object, rng.choice(METHODS)))
+        return ret
+
+    def seed_db(self, db, batch_size=amdb.DEFAULT_BATCH_SIZE):
+        """
+        Creates the tables and bulk loads the data with explicit ids
+        Does nothing if the first user is already in the database.
+
+        :param db: connected AMDatabase in management mode
+        :param batch_size: maximum number of rows in one INSERT
+        :returns: True if the data was written
+        :raise Exception if the RBAC tables are not empty
+        """
+        db.create_tables()
+        try:
+            db.get_user(self.user_uuid(0))
+            return False
+        except amdb.NotExist:
+            pass
+        for model in (AMdbUser, AMdbRole, AMdbResource, AMdbUserRole, AMdbRoleResource):
+            if model.select().exists():
+                raise Exception("The {0} table is not empty".format(model._meta.db_table))
+
+        tables = ((AMdbResource, (AMdbResource.id, AMdbResource.path, AMdbResource.op, AMdbResource.desc),
+                   [(index + 1, path, method, "") for index, (path, method) in enumerate(self.resource_rows())]),
+                  (AMdbRole, (AMdbRole.id, AMdbRole.name, AMdbRole.is_service, AMdbRole.is_chroot, AMdbRole.desc),
+                   [(role + 1, self.role_name(role), False, False, "") for role in range(self.roles)]),
+                  (AMdbUser, (AMdbUser.id, AMdbUser.user_uuid, AMdbUser.name, AMdbUser.is_service, AMdbUser.email),
+                   [(user + 1, self.user_uuid(user), self.user_uuid(user), False, "") for user in range(self.users)]),
+                  (AMdbRoleResource, (AMdbRoleResource.role_id, AMdbRoleResource.res_id),
+                   [(role + 1, resource + 1) for role, resource in self.role_resource_ids()]),
+                  (AMdbUserRole, (AMdbUserRole.user_id, AMdbUserRole.role_id),
+                   [(user + 1, role + 1) for user, role in self.user_role_ids()]))
+        for model, fields, rows in tables:
+            model_batch_size = batch_size
+            if isinstance(amdb.AM_DB.obj, SqliteDatabase):
+                model_batch_size = min(batch_size, SQLITE_MAX_VARIABLES // len(fields))
+            db.insert_rows(model, fields, rows, model_batch_size)
+        return True
@@ -19,12 +19,27 @@ amdb module
 Maintains AM database
 """
 
+import functools
+import itertools
+import threading
+
 from peewee import Model
 from peewee import MySQLDatabase
-from peewee import CharField, BooleanField, ForeignKeyField
-from peewee import DoesNotExist
+from peewee import Proxy
+from peewee import CharField, BooleanField, ForeignKeyField, BigIntegerField
+from peewee import DatabaseError, DoesNotExist, IntegrityError
+from peewee import JOIN
+from peewee import fn
+from playhouse.pool import PooledMySQLDatabase
+
+DEFAULT_STALE_TIMEOUT = 300
+DEFAULT_BATCH_SIZE = 1000
 
-AM_DB = MySQLDatabase(None)
+AM_DB = Proxy()
+DIRECT_DB = MySQLDatabase(None)
+POOLED_DB = PooledMySQLDatabase(None)
+AM_DB.initialize(DIRECT_DB)
+DB_INIT_LOCK = threading.Lock()
 
 
 class BaseAMModel(Model):
@@ -81,6 +96,13 @@ class AMdbUserRole(BaseAMModel):
         db_table = 'user_role'
 
 
+class AMdbVersion(BaseAMModel):
+    version = BigIntegerField(default=0)
+
+    class Meta(object):
+        db_table = 'am_version'
+
+
 class NotExist(Exception):
     def __init__(self, value):
         self.value = value
@@ -105,10 +127,48 @@ class NotAllowedOperation(Exception):
         return repr(self.value)
 
 
+def is_missing_table(error):
+    """
+    Tells whether a DB error is caused by a missing table: MySQL error 1146 or "no such table" of SQLite
+
+    :param error: DatabaseError raised by a query
+    :rtype: bool
+    """
+    return bool(error.args) and error.args[0] == 1146 or "no such table" in str(error)
+
+
+def pool_options(db_config):
+    """
+    Returns the connection pool parameters of AMDatabase from the DB section of the config
+
+    :param db_config: DB section of the config
+    :rtype: dict
+    """
+    return {'max_connections': int(db_config.get('pool_max_connections', 0)),
+            'stale_timeout': int(db_config.get('pool_stale_timeout', DEFAULT_STALE_TIMEOUT))}
+
+
+def bumps_version(func):
+    """
+    Runs a mutating AMDatabase method in a transaction which also increments the RBAC version
+    """
+    @functools.wraps(func)
+    def versioned_function(self, *args, **kwargs):
+        self._ensure_version_table()
+        with self.am_db.atomic():
+            ret = func(self, *args, **kwargs)
+            self._bump_version()
+        return ret
+    return versioned_function
+
+
 class AMDatabase(object):
     """ AM Database handler class """
 
-    def __init__(self, db_name, db_user, db_pwd, db_addr, db_port, logger, management_mode=False):
+    version_table_ready = False
+
+    def __init__(self, db_name, db_user, db_pwd, db_addr, db_port, logger, management_mode=False,
+                 max_connections=0, stale_timeout=DEFAULT_STALE_TIMEOUT):
         """
         Creates an instance of AM database
 
@@ -118,6 +178,8 @@ class AMDatabase(object):
         :param db_addr: Address of the MySQL server
         :param db_port: Port of the MySQL server (type int)
         :param logger: Logger instance to be used
+        :param max_connections: Size of the connection pool, 0 means no pooling
+        :param stale_timeout: Seconds after a pooled connection is not reused
 
         :Example:
         db = AMDatabase(db_name='am_database',db_addr='127.0.0.1',
@@ -134,6 +196,8 @@ class AMDatabase(object):
         self.db_port = db_port
         self.am_db = AM_DB
         self.management_mode = management_mode
+        self.max_connections = max_connections
+        self.stale_timeout = stale_timeout
 
         if logger is None:
             raise Exception("You did not give me a logger to use. That's a no-no!")
@@ -147,18 +211,41 @@ class AMDatabase(object):
         """
 
         try:
-            self.am_db.init(self.db_name,
-                            host=self.db_host, port=self.db_port,
-                            user=self.db_user, password=self.db_pwd)
+            if self.max_connections:
+                self._init_pool()
+            else:
+                with DB_INIT_LOCK:
+                    self.am_db.initialize(DIRECT_DB)
+                self.am_db.init(self.db_name,
+                                host=self.db_host, port=self.db_port,
+                                user=self.db_user, password=self.db_pwd)
             self.am_db.connect()
             self.logger.debug('Connected to database')
         except Exception as ex:
             self.logger.error('Error occured while connecting to database')
             raise Exception('Error occured while connecting to database')
 
+    def _init_pool(self):
+        """
+        Points AM_DB to the connection pool
+        The pool is re-initialized only when the connection parameters change,
+        so that the pooled connections survive across requests.
+        """
+        connect_kwargs = {'host': self.db_host, 'port': self.db_port,
+                          'user': self.db_user, 'password': self.db_pwd}
+        with DB_INIT_LOCK:
+            if (POOLED_DB.database != self.db_name or POOLED_DB.connect_kwargs != connect_kwargs or
+                    POOLED_DB.max_connections != self.max_connections or
+                    POOLED_DB.stale_timeout != self.stale_timeout):
+                POOLED_DB.close_all()
+                POOLED_DB.init(self.db_name, max_connections=self.max_connections,
+                               stale_timeout=self.stale_timeout, **connect_kwargs)
+            self.am_db.initialize(POOLED_DB)
+
     def close(self):
         """
         Closes the database connection
+        In pooled mode the connection is returned to the pool
         :raise Exception on failure
         """
 
@@ -170,13 +257,15 @@ class AMDatabase(object):
             raise Exception('Error closing connection to database')
 
     def create_tables(self):
-        self.am_db.create_tables([AMdbUser, AMdbRole, AMdbResource, AMdbUserRole, AMdbRoleResource], safe=True)
+        self.am_db.create_tables([AMdbUser, AMdbRole, AMdbResource, AMdbUserRole, AMdbRoleResource, AMdbVersion],
+                                 safe=True)
         # AMdbUser.create_table(safe=True)
         # AMdbRole.create_table(safe=True)
         # AMdbResource.create_table(safe=True)
         # AMdbUserRole.create_table(safe=True)
         # AMdbRoleResource.create_table(safe=True)
 
+    @bumps_version
     def create_user(self, uuid, name, em='', service=False):
         """
         Creates a user with a UUID and optional email parameter
@@ -215,6 +304,7 @@ class AMDatabase(object):
         except DoesNotExist:
             raise NotExist('User does not exist: {0}'.format(uuid))
 
+    @bumps_version
     def delete_user(self, uuid):
         """
         Deletes user; also removes reference from other tables
@@ -277,6 +367,7 @@ class AMDatabase(object):
                                    'email': user.email}
         return ret
 
+    @bumps_version
     def create_role(self, role_name, role_desc='', is_chroot=False):
         """
         Creates role
@@ -312,6 +403,7 @@ class AMDatabase(object):
         except DoesNotExist:
             raise NotExist('Role does not exsist: {}'.format(role_name))
 
+    @bumps_version
     def delete_role(self, role_name):
         """
         Deletes role by role name;
@@ -334,6 +426,7 @@ class AMDatabase(object):
         query = (AMdbRole.delete().where(AMdbRole.id == role.id))
         query.execute()
 
+    @bumps_version
     def set_role_param(self, role_name, desc=None, is_chroot=False):
         """
         Sets role optional parameters
@@ -440,6 +533,7 @@ class AMDatabase(object):
                 ret[res.path].append(res.op)
         return ret
 
+    @bumps_version
     def add_user_role(self, uuid, role_name):
         """
         Adds a role to a user
@@ -473,6 +567,7 @@ class AMDatabase(object):
                               AMdbUserRole.role_id: role.id}))
             query.execute()
 
+    @bumps_version
     def delete_user_role(self, uuid, role_name):
         """
         Deletes role for a given user (removes permission).
@@ -526,34 +621,67 @@ class AMDatabase(object):
 
     def get_user_resources(self, uuid):
         """
-        Gets resources belonging to a user, returns a list of resources
+        Gets resources belonging to a user with one query
         returns a dict whith resource path as keys,
-        allowed operations as values in a list
+        allowed operations as values in a set
 
         :param uuid: user identifier
         :returns: a dict where the keys are resource names,
-        values are the operations in a list
-        :rtype: dict[str:list[str]]
+        values are the operations in a set
+        :rtype: dict[str:set[str]]
+        :raise NotExist if the user is not present
         """
         self.logger.debug('Called DB function: get_user_resources')
-        try:
-            user = self.get_user(uuid)
-        except NotExist as ex:
-            raise NotExist(ex)
-
-        roles = AMdbUserRole.select().where(
-            AMdbUserRole.user_id == user.id)
-        res = dict({})
-        for role_row in roles:
-            role_res = AMdbRoleResource.select().where(
-                AMdbRoleResource.role_id == role_row.role_id)
-            for r_res_row in role_res:
-                if r_res_row.res_id.path not in res.keys():
-                    res[r_res_row.res_id.path] = [r_res_row.res_id.op]
-                else:
-                    res[r_res_row.res_id.path].append(r_res_row.res_id.op)
+        query = (AMdbUser.select(AMdbResource.path, AMdbResource.op)
+                 .join(AMdbUserRole, JOIN.LEFT_OUTER, on=(AMdbUserRole.user_id == AMdbUser.id))
+                 .join(AMdbRoleResource, JOIN.LEFT_OUTER, on=(AMdbRoleResource.role_id == AMdbUserRole.role_id))
+                 .join(AMdbResource, JOIN.LEFT_OUTER, on=(AMdbResource.id == AMdbRoleResource.res_id))
+                 .where(AMdbUser.user_uuid == uuid)
+                 .tuples())
+        found = False
+        res = dict()
+        for path, op in query:
+            found = True
+            if path is None:
+                continue
+            if path not in res:
+                res[path] = set([op])
+            else:
+                res[path].add(op)
+        if not found:
+            raise NotExist('User does not exist: {0}'.format(uuid))
         return res
 
+    def get_user_permission_key(self, uuid):
+        """
+        Gets what the permissions of a user depend on, with one query:
+        the RBAC version and the ids of the roles of the user.
+        Users with equal keys have the same permissions.
+
+        :param uuid: user identifier
+        :returns: (version, role ids), None if the database has no version yet
+        :rtype: tuple(int, frozenset[int])
+        :raise NotExist if the user is not present
+        """
+        self.logger.debug('Called DB function: get_user_permission_key')
+        version = AMdbVersion.select(AMdbVersion.version).where(AMdbVersion.id == 1)
+        query = (AMdbUser.select(AMdbUserRole.role_id, version)
+                 .join(AMdbUserRole, JOIN.LEFT_OUTER, on=(AMdbUserRole.user_id == AMdbUser.id))
+                 .where(AMdbUser.user_uuid == uuid)
+                 .tuples())
+        try:
+            rows = list(query)
+        except DatabaseError as error:
+            # connection failures reach the caller, only the missing table disables the key
+            if not is_missing_table(error):
+                raise
+            self.logger.debug('The am_version table is missing')
+            return None
+        if not rows:
+            raise NotExist('User does not exist: {0}'.format(uuid))
+        return rows[0][1] or 0, frozenset(role_id for role_id, _ in rows if role_id is not None)
+
+    @bumps_version
     def add_resource_to_role(self, role_name, res_path, res_op):
         """
         Assings a resource+operation to a role
@@ -609,6 +737,7 @@ class AMDatabase(object):
                 res[row[0]].append(row[1])
         return res
 
+    @bumps_version
     def delete_role_resource(self, role_name, res_path, res_op):
         """
         Deletes a resource from a role (like removing permission)
@@ -630,6 +759,7 @@ class AMDatabase(object):
             raise NotExist('Role {0} has no such resource:operation : {1}:{2}'
                            .format(role_name, res_path, res_op))
 
+    @bumps_version
     def create_resource(self, res_path, res_op, res_desc=''):
         """ Creates resource """
         self.logger.debug('Called DB function: create_resource')
@@ -642,6 +772,7 @@ class AMDatabase(object):
             resource = AMdbResource.create(path=res_path, op=res_op, desc=res_desc)
             return resource
 
+    @bumps_version
     def update_resource(self, res_path, res_op, res_desc):
         """ updates resource """
         self.logger.debug('Called DB function: update_resource')
@@ -762,6 +893,100 @@ class AMDatabase(object):
         result = [row for row in query]
         return result
 
+    def _ensure_version_table(self):
+        """
+        Creates the am_version table of databases created before it existed
+        """
+        if not AMDatabase.version_table_ready:
+            AMdbVersion.create_table(fail_silently=True)
+            if not AMdbVersion.select().where(AMdbVersion.id == 1).exists():
+                try:
+                    AMdbVersion.insert(id=1, version=0).execute()
+                except IntegrityError:
+                    self.logger.debug('The am_version row was created by someone else')
+            AMDatabase.version_table_ready = True
+
+    def _bump_version(self):
+        """
+        Increments the RBAC version; must run in the transaction of the change
+        """
+        AMdbVersion.update(version=AMdbVersion.version + 1).where(AMdbVersion.id == 1).execute()
+
+    def get_version(self):
+        """
+        Gets the RBAC version, which every mutating method increments
+
+        :returns: the version, 0 if nothing was changed yet
+        :rtype: int
+        """
+        self.logger.debug('Called DB function: get_version')
+        try:
+            return AMdbVersion.get(AMdbVersion.id == 1).version
+        except DoesNotExist:
+            return 0
+
+    def get_rbac_version(self):
+        """
+        Gets a cheap value which changes when the RBAC tables change
+        It is the am_version counter; databases without that table fall back to
+        the row counts and maximum ids of user_role, role_resource and resource
+
+        :returns: version of the RBAC tables
+        :rtype: tuple
+        """
+        self.logger.debug('Called DB function: get_rbac_version')
+        try:
+            return (self.get_version(),)
+        except DatabaseError as error:
+            if not is_missing_table(error):
+                raise
+            self.logger.debug('The am_version table is missing')
+        version = []
+        for model in (AMdbUserRole, AMdbRoleResource, AMdbResource):
+            version.extend(model.select(fn.COUNT(model.id), fn.MAX(model.id)).tuples().get())
+        return tuple(version)
+
+    def get_rbac_tables(self):
+        """
+        Gets the rows needed for authorization from every RBAC table
+
+        :returns: dict of row tuples: users (id, user_uuid), roles (id, name),
+        resources (id, path, op), user_roles (user_id, role_id), role_resources (role_id, res_id)
+        :rtype: dict[str:list[tuple]]
+        """
+        self.logger.debug('Called DB function: get_rbac_tables')
+        return {'users': list(AMdbUser.select(AMdbUser.id, AMdbUser.user_uuid).tuples()),
+                'roles': list(AMdbRole.select(AMdbRole.id, AMdbRole.name).tuples()),
+                'resources': list(AMdbResource.select(AMdbResource.id, AMdbResource.path, AMdbResource.op).tuples()),
+                'user_roles': list(AMdbUserRole.select(AMdbUserRole.user_id, AMdbUserRole.role_id).tuples()),
+                'role_resources': list(AMdbRoleResource.select(AMdbRoleResource.role_id,
+                                                               AMdbRoleResource.res_id).tuples())}
+
+    @bumps_version
+    def insert_rows(self, model, fields, rows, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Inserts rows into a table with multi-row INSERTs, all in one transaction
+        Meant for bulk loading: the rows are not checked like in the create_* methods
+        and the statements are built directly, without creating a model instance per row
+
+        :param model: AM model of the table
+        :param fields: fields of the model the values of the rows belong to
+        :param rows: list of value tuples
+        :param batch_size: maximum number of rows in one INSERT
+        :returns: number of inserted rows
+        :rtype: int
+        """
+        self.logger.debug('Called DB function: insert_rows')
+        quote = self.am_db.quote_char
+        columns = ', '.join(quote + field.db_column + quote for field in fields)
+        row_sql = '(' + ', '.join([self.am_db.interpolation] * len(fields)) + ')'
+        sql = 'INSERT INTO {0}{1}{0} ({2}) VALUES '.format(quote, model._meta.db_table, columns)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            self.am_db.execute_sql(sql + ', '.join([row_sql] * len(batch)),
+                                   list(itertools.chain.from_iterable(batch)))
+        return len(rows)
+
     def get_roles_for_permission(self, perm_name, op):
         """
         Gets all roles where the permission is included
@@ -15,8 +15,15 @@
 import re
 import os
 import json
+import errno
+import threading
+import time
 import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import access_management.db.amdb as amdb
+import access_management.backend.passwordchecker as passwordchecker
 import yarf.restfullogger as logger
 from cmframework.apis import cmclient
 from keystoneauth1 import session
@@ -28,6 +35,548 @@ from access_management.config.amconfigparser import AMConfigParser
 import access_management.config.defaults as defaults
 
 
+KEYSTONE_WORKERS = 4
+DEFAULT_USER_DIRECTORY_TTL = 30
+DEFAULT_USER_DIRECTORY_SIZE = 10000
+CM_WAIT_INITIAL_DELAY = 0.01
+CM_WAIT_MAX_DELAY = 1.0
+CM_WAIT_ATTEMPTS = 3
+CM_WAIT_TIMEOUT = 6
+DEFAULT_JOBS_DIR = "/var/lib/access_management/jobs"
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_JOB_QUEUE_SIZE = 32
+DEFAULT_JOB_TTL = 3600
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+CM_LAYOUT_LIST = "list"
+CM_LAYOUT_MIRRORED = "mirrored"
+CM_LAYOUT_KEYED = "keyed"
+
+
+class UserDirectory(object):
+    """
+    Process-wide index of the Keystone users looked up by the handlers
+    Users are indexed by id and by name and kept for a short TTL. On a miss only the asked user is
+    fetched from Keystone, the handlers changing a user invalidate its entry.
+    """
+    def __init__(self, ttl=DEFAULT_USER_DIRECTORY_TTL, max_size=DEFAULT_USER_DIRECTORY_SIZE):
+        """
+        :param ttl: lifetime of an entry in seconds, 0 disables the directory
+        :param max_size: maximum number of users kept
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.by_id = OrderedDict()
+        self.by_name = {}
+        self.lock = threading.Lock()
+
+    def get(self, user):
+        """
+        Looks up a user by id or name
+
+        :returns: dict of the name, id and default project of the user, None on a miss
+        :rtype: dict
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.by_id.get(user) or self.by_name.get(user)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._remove(entry[1])
+                return None
+            return dict(entry[1])
+
+    def put(self, ks_user):
+        """
+        Adds or refreshes a user returned by Keystone
+
+        :param ks_user: keystoneclient user resource
+        :returns: dict of the name, id and default project of the user
+        :rtype: dict
+        """
+        info = {"name": ks_user.name, "id": ks_user.id, "project": getattr(ks_user, "default_project_id", None)}
+        if self.ttl <= 0:
+            return info
+        with self.lock:
+            old = self.by_id.get(info["id"]) or self.by_name.get(info["name"])
+            if old is not None:
+                self._remove(old[1])
+            entry = (time.time() + self.ttl, info)
+            self.by_id[info["id"]] = entry
+            self.by_name[info["name"]] = entry
+            while len(self.by_id) > self.max_size:
+                self._remove(self.by_id.itervalues().next()[1])
+        return dict(info)
+
+    def invalidate(self, user):
+        """
+        Drops a user, given by id or name, from the directory
+        """
+        with self.lock:
+            entry = self.by_id.get(user) or self.by_name.get(user)
+            if entry is not None:
+                self._remove(entry[1])
+
+    def clear(self):
+        with self.lock:
+            self.by_id.clear()
+            self.by_name.clear()
+
+    def _remove(self, info):
+        entry = self.by_id.pop(info["id"], None)
+        if entry is not None and self.by_name.get(info["name"]) is entry:
+            del self.by_name[info["name"]]
+
+
+user_directory = UserDirectory()
+
+
+class NameIdCache(object):
+    """
+    Process-wide name to id map of Keystone roles or projects
+    The map is loaded with one list call and loaded again when a name is missing from it.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def get(self, name, list_function):
+        """
+        Returns the id of a name, listing the objects if the name is not known
+
+        :param name: name of the role or project
+        :param list_function: lists every role or project from Keystone
+        :returns: id of the name, None if it does not exist
+        :rtype: str
+        :raise the exception of list_function
+        """
+        object_id = self.ids.get(name)
+        if object_id is not None:
+            return object_id
+        with self.lock:
+            object_id = self.ids.get(name)
+            if object_id is None:
+                self.ids = dict((element.name, str(element.id)) for element in list_function())
+                object_id = self.ids.get(name)
+        return object_id
+
+    def put(self, name, object_id):
+        with self.lock:
+            self.ids[name] = str(object_id)
+
+    def remove(self, name):
+        with self.lock:
+            self.ids.pop(name, None)
+
+    def clear(self):
+        with self.lock:
+            self.ids = {}
+
+
+role_ids = NameIdCache()
+project_ids = NameIdCache()
+
+
+class SharedResources(object):
+    """
+    Config, DB handler and Keystone session shared by the handler instances of the process
+    The config file is parsed again, and the DB handler rebuilt, only when the mtime of the file changes.
+    The Keystone session keeps the HTTP connections, every request still authenticates with its own token.
+    """
+    def __init__(self, config_file=AMConfigParser.cfg_file):
+        self.config_file = config_file
+        self.lock = threading.Lock()
+        self.current = None
+        self.session = session.Session()
+        self.pool = None
+
+    def get(self, logger):
+        """
+        Returns the config and the DB handler, reloading them if the config file changed
+
+        :param logger: logger of the DB handler
+        :returns: parsed config and AMDatabase instance
+        :rtype: tuple(dict, AMDatabase)
+        """
+        try:
+            mtime = os.stat(self.config_file).st_mtime
+        except OSError:
+            mtime = None
+        current = self.current
+        if current is None or current[0] != mtime:
+            with self.lock:
+                if self.current is None or self.current[0] != mtime:
+                    config = AMConfigParser(self.config_file).parse()
+                    db = amdb.AMDatabase(db_name=config["DB"]["name"], db_addr=config["DB"]["addr"],
+                                         db_port=int(config["DB"]["port"]), db_user=config["DB"]["user"],
+                                         db_pwd=config["DB"]["pwd"], logger=logger,
+                                         **amdb.pool_options(config["DB"]))
+                    self.current = (mtime, config, db)
+                    user_directory.ttl = float(config.get("Keystone", {}).get("user_directory_ttl",
+                                                                              DEFAULT_USER_DIRECTORY_TTL))
+                    job_manager.configure(config.get("Jobs", {}), logger)
+                current = self.current
+        return current[1], current[2]
+
+    def keystone_client(self, auth):
+        """
+        Returns a Keystone client using the shared session with the given authentication
+
+        :param auth: keystoneauth identity plugin of the request
+        :rtype: keystoneclient.v3.client.Client
+        """
+        return client.Client(session=self.session, auth=auth)
+
+    def keystone_pool(self):
+        """
+        Returns the bounded thread pool of the concurrent Keystone calls
+        It is created on first use, so that it is created in the worker process.
+
+        :rtype: ThreadPoolExecutor
+        """
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ThreadPoolExecutor(max_workers=KEYSTONE_WORKERS)
+        return self.pool
+
+
+shared_resources = SharedResources()
+
+
+class CMWaiter(object):
+    """
+    Waits for a change of a CM property to become visible
+    CMClient has no change notification, so the property is read again with exponential backoff,
+    starting after a few milliseconds, until the change is visible or the deadline passes.
+    """
+    def __init__(self, initial_delay=CM_WAIT_INITIAL_DELAY, max_delay=CM_WAIT_MAX_DELAY):
+        """
+        :param initial_delay: seconds before the first retry
+        :param max_delay: maximum seconds between two retries
+        """
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+
+    def wait(self, check, deadline):
+        """
+        :param check: function returning True once the change is visible
+        :param deadline: time.time() value after which the waiting stops
+        :returns: True if the change became visible before the deadline
+        """
+        delay = self.initial_delay
+        while True:
+            if check():
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.max_delay)
+
+
+cm_waiter = CMWaiter()
+
+
+class JobError(Exception):
+    """
+    The job cannot be accepted
+    """
+
+
+class JobManager(object):
+    """
+    Runs long operations in the background on a bounded number of threads
+    At most queue_size jobs are queued or running in the process, further jobs are refused.
+    The state of every job is written into its own file, so that any worker process can report it
+    and the jobs of a stopped process show up as failed. Finished jobs are removed after the TTL.
+    """
+    def __init__(self, directory=DEFAULT_JOBS_DIR, workers=DEFAULT_JOB_WORKERS, queue_size=DEFAULT_JOB_QUEUE_SIZE,
+                 ttl=DEFAULT_JOB_TTL):
+        """
+        :param directory: directory of the job files, None keeps the jobs in the process
+        :param workers: number of threads running the jobs
+        :param queue_size: maximum number of queued and running jobs
+        :param ttl: seconds a finished job is kept
+        """
+        self.directory = directory
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.jobs = {}
+        self.pending = 0
+        self.executor = None
+        self.last_cleanup = 0
+        self.lock = threading.Lock()
+
+    def configure(self, config, logger):
+        """
+        Applies the Jobs section of the config, the number of workers only before the first job
+        The directory is created if it is missing, a directory which cannot be written is logged
+        and every job is refused until it is fixed.
+        """
+        self.directory = config.get("directory", DEFAULT_JOBS_DIR) or None
+        self.workers = int(config.get("workers", DEFAULT_JOB_WORKERS))
+        self.queue_size = int(config.get("queue_size", DEFAULT_JOB_QUEUE_SIZE))
+        self.ttl = float(config.get("ttl", DEFAULT_JOB_TTL))
+        if self.directory is None:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+        except OSError as ex:
+            logger.error("Failed to create the jobs directory, background jobs are refused: {0}".format(ex))
+            return
+        if not os.access(self.directory, os.W_OK | os.X_OK):
+            logger.error("The {0} jobs directory is not writable, background jobs are refused"
+                         .format(self.directory))
+
+    def submit(self, operation, function, args, success_message, logger):
+        """
+        Queues an operation
+
+        :param operation: description of the operation shown in the job state
+        :param function: function returning a (state, message) tuple like the handler helpers
+        :param args: arguments of the function
+        :param success_message: description of the job if the function succeeds
+        :param logger: logger of the job
+        :returns: id of the job, None if the queue is full
+        :rtype: str
+        :raise JobError if the state of the job cannot be saved
+        """
+        with self.lock:
+            if self.pending >= self.queue_size:
+                return None
+            self.pending += 1
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        now = time.time()
+        job = {"id": uuid.uuid4().hex, "operation": operation, "state": JOB_QUEUED, "description": "",
+               "created": now, "updated": now, "pid": os.getpid()}
+        try:
+            # other worker processes answer the state requests from the file
+            self._write(job["id"], json.dumps(job))
+        except (IOError, OSError) as ex:
+            with self.lock:
+                self.pending -= 1
+            raise JobError("Failed to save the state of the job in {0}: {1}".format(self.directory, ex))
+        with self.lock:
+            self.jobs[job["id"]] = job
+        try:
+            self.executor.submit(self._run, job, function, args, success_message, logger)
+        except Exception:
+            with self.lock:
+                self.pending -= 1
+            raise
+        self._cleanup(logger)
+        return job["id"]
+
+    def _run(self, job, function, args, success_message, logger):
+        try:
+            self._update(job, logger, state=JOB_RUNNING)
+            try:
+                state, message = function(*args)
+            except Exception as ex:
+                state, message = False, "{0}".format(ex)
+            if state:
+                logger.info("Job {0} ({1}) succeeded".format(job["id"], job["operation"]))
+                self._update(job, logger, state=JOB_SUCCEEDED, description=success_message)
+            else:
+                logger.error("Job {0} ({1}) failed: {2}".format(job["id"], job["operation"], message))
+                self._update(job, logger, state=JOB_FAILED, description="{0}".format(message))
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def get(self, job_id):
+        """
+        Returns the state of a job of any process sharing the directory
+
+        :returns: copy of the job, None if it does not exist
+        :rtype: dict
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.directory is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, job_id + ".json")) as job_file:
+                job = json.load(job_file)
+        except (IOError, ValueError):
+            return None
+        if job["state"] in (JOB_QUEUED, JOB_RUNNING) and not self._alive(job["pid"]):
+            job["state"] = JOB_FAILED
+            job["description"] = "The job was interrupted, because its server process stopped."
+        return job
+
+    def _update(self, job, logger, **changes):
+        with self.lock:
+            job.update(changes)
+            job["updated"] = time.time()
+        self._save(job, logger)
+
+    def _save(self, job, logger):
+        with self.lock:
+            self.jobs[job["id"]] = job
+            data = json.dumps(job)
+        try:
+            self._write(job["id"], data)
+        except Exception as ex:
+            logger.error("Failed to save the state of job {0}: {1}".format(job["id"], ex))
+
+    def _write(self, job_id, data):
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, job_id + ".json")
+        with open(path + ".tmp", "w") as job_file:
+            job_file.write(data)
+        os.rename(path + ".tmp", path)
+
+    def _cleanup(self, logger):
+        """
+        Forgets the finished jobs older than the TTL, at most once a minute
+        """
+        now = time.time()
+        with self.lock:
+            if now - self.last_cleanup < 60:
+                return
+            self.last_cleanup = now
+            expired = [job_id for job_id, job in self.jobs.iteritems()
+                       if job["state"] in (JOB_SUCCEEDED, JOB_FAILED) and job["updated"] + self.ttl < now]
+            for job_id in expired:
+                del self.jobs[job_id]
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime + self.ttl < now:
+                    os.remove(path)
+            except OSError as ex:
+                logger.error("Failed to remove the job file {0}: {1}".format(path, ex))
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as ex:
+            return ex.errno != errno.ESRCH
+        return True
+
+
+job_manager = JobManager()
+
+
+class CMUserStore(object):
+    """
+    Entries of the chroot or linux users in CM, e.g. in cloud.chroot
+    list: the property holds the JSON list of every entry, a change rewrites the list.
+    mirrored: every user also has its own <property>.<username> property, a lookup reads only that,
+    a change writes it and still rewrites the list for the consumers reading the list.
+    keyed: only the per-user properties are read and written, to be used once every consumer reads them.
+    The mirrored and keyed layouts copy the entries of the list into the per-user properties on first use
+    in the process. The list itself is never emptied.
+    """
+    migrated = set()
+    migrate_lock = threading.Lock()
+
+    def __init__(self, list_name, layout=CM_LAYOUT_LIST, logger=None):
+        """
+        :param list_name: name of the CM property, e.g. cloud.chroot
+        :param layout: CM_LAYOUT_LIST, CM_LAYOUT_MIRRORED or CM_LAYOUT_KEYED
+        :param logger: logger instance to be used
+        """
+        if layout not in (CM_LAYOUT_LIST, CM_LAYOUT_MIRRORED, CM_LAYOUT_KEYED):
+            if logger is not None:
+                logger.error("Unknown CM user layout {0}, the list layout is used".format(layout))
+            layout = CM_LAYOUT_LIST
+        self.list_name = list_name
+        self.layout = layout
+        self.logger = logger
+        self.cmc = cmclient.CMClient()
+        self.user_list = None
+
+    def _key(self, username):
+        return "{0}.{1}".format(self.list_name, username)
+
+    def _load_list(self):
+        if self.user_list is None:
+            value = self.cmc.get_property(self.list_name)
+            self.user_list = json.loads(value) if value else []
+        return self.user_list
+
+    def _find(self, username):
+        for entry in self._load_list():
+            if entry["name"] == username:
+                return dict(entry)
+        return None
+
+    def get(self, username):
+        """
+        :returns: the entry of the user, None if the user has no entry
+        :rtype: dict
+        """
+        if self.layout == CM_LAYOUT_LIST:
+            return self._find(username)
+        self.migrate()
+        value = self.cmc.get_property(self._key(username))
+        if value:
+            return json.loads(value)
+        if self.layout == CM_LAYOUT_MIRRORED:
+            # entries added to the list by others after the migration
+            return self._find(username)
+        return None
+
+    def put(self, entry):
+        """
+        Adds or replaces the entry of a user
+        """
+        if self.layout != CM_LAYOUT_LIST:
+            self.migrate()
+        if self.layout != CM_LAYOUT_KEYED:
+            user_list = self._load_list()
+            for index, element in enumerate(user_list):
+                if element["name"] == entry["name"]:
+                    user_list[index] = entry
+                    break
+            else:
+                user_list.append(entry)
+            if self.logger is not None:
+                self.logger.debug("{0} user list after the change: {1}".format(self.list_name,
+                                                                               json.dumps(user_list)))
+            self.cmc.set_property(self.list_name, json.dumps(user_list))
+        if self.layout != CM_LAYOUT_LIST:
+            # written after the list, so the state checks see the change once the list has it as well
+            self.cmc.set_property(self._key(entry["name"]), json.dumps(entry))
+
+    def migrate(self):
+        """
+        Copies the entries of the list into per-user properties, once per process and property
+        Users that already have their own property keep it, the list is left as it is.
+
+        :returns: number of copied entries
+        """
+        if self.list_name in CMUserStore.migrated:
+            return 0
+        with CMUserStore.migrate_lock:
+            if self.list_name in CMUserStore.migrated:
+                return 0
+            copied = 0
+            for entry in self._load_list():
+                if not self.cmc.get_property(self._key(entry["name"])):
+                    self.cmc.set_property(self._key(entry["name"]), json.dumps(entry))
+                    copied += 1
+            if copied and self.logger is not None:
+                self.logger.info("{0} users of {1} copied to per-user properties".format(copied, self.list_name))
+            CMUserStore.migrated.add(self.list_name)
+            return copied
+
+
 class AMApiBase(RestResource):
     """
     The AMApiBase is the base class that all Access Management REST API endpoints should inherit form. It
@@ -37,11 +586,7 @@ class AMApiBase(RestResource):
     def __init__(self):
         super(AMApiBase, self).__init__()
         self.logger = logger.get_logger()
-        configparser = AMConfigParser()
-        self.config = configparser.parse()
-        self.db = amdb.AMDatabase(db_name=self.config["DB"]["name"], db_addr=self.config["DB"]["addr"],
-                                    db_port=int(self.config["DB"]["port"]), db_user=self.config["DB"]["user"],
-                                    db_pwd=self.config["DB"]["pwd"], logger=self.logger)
+        self.config, self.db = shared_resources.get(self.logger)
         if self.get_token() != "":
             self.keystone = self.auth_keystone()
         self.token = self.get_token()
@@ -131,34 +676,26 @@ class AMApiBase(RestResource):
     def passwd_validator(self, passwd):
         if (re.search(r"^(?=.*?[A-Z])(?=.*?[0-9])(?=.*?[][.,:;/(){}<>~\!?@#$%^&*_=+-])[][a-zA-Z0-9.,:;/(){}<>~\!?@#$%^&*_=+-]{8,255}$", passwd) is None):
             return "The password must have a minimum length of 8 characters (maximum is 255 characters). The allowed characters are lower case letters (a-z), upper case letters (A-Z), digits (0-9), and special characters (][.,:;/(){}<>~\\!?@#$%^&*_=+-). The password must contain at least one upper case letter, one digit and one special character."
-        pwd_dict_check = os.system("echo '{0}' | cracklib-check | grep OK &>/dev/null".format(passwd))
-        if pwd_dict_check != 0:
+        dictionary = self.config.get("Password", {}).get("dictionary", passwordchecker.DEFAULT_DICTIONARY)
+        checker = passwordchecker.get_checker(dictionary, self.logger)
+        if checker.check(passwd) is not None:
             return "The password is incorrect: It cannot contain a dictionary word."
         return None
 
     def get_role_id(self, role_name):
         self.logger.debug("Start get_role_id")
         try:
-            role_list = self.keystone.roles.list()
+            return role_ids.get(role_name, self.keystone.roles.list)
         except Exception as ex:
             self.logger.error("{0}".format(ex))
             return False, "{0}".format(ex)
 
-        for role in role_list:
-            if role.name == role_name:
-                return str(role.id)
-
     def get_project_id(self, project_name):
         self.logger.debug("Start get_project_id")
-        project_id = None
         try:
-            project_list = self.keystone.projects.list()
+            return project_ids.get(project_name, self.keystone.projects.list)
         except Exception:
-            return project_id
-
-        for project in project_list:
-            if project.name == project_name:
-                return str(project.id)
+            return None
 
     def get_uuid_from_token(self):
         self.logger.debug("Start get_uuid_from_token")
@@ -181,6 +718,12 @@ class AMApiBase(RestResource):
                 self.keystone.roles.revoke(role_id, user=user_id, project=proj_id)
             else:
                 return False, "Not allowed method for role modification"
+        except exceptions.http.NotFound as ex:
+            # the role or the project may have been recreated with a new id
+            role_ids.clear()
+            project_ids.clear()
+            self.logger.error("{0}".format(ex))
+            return False, "{0}".format(ex)
         except Exception as ex:
             self.logger.error("{0}".format(ex))
             return False, "{0}".format(ex)
@@ -199,21 +742,51 @@ class AMApiBase(RestResource):
             self.logger.error(message)
             return False, message
 
-        state, message = self.send_role_request_and_check_response(role_id, user_id, method, um_proj_id)
-        if project and project != um_proj_id:
-            state, message = self.send_role_request_and_check_response(role_id, user_id, method, project)
-
+        role_id_list = [role_id]
         if need_admin_role and (role_name == defaults.INF_ADMIN_ROLE_NAME or role_name == defaults.OS_ADMIN_ROLE_NAME):
             admin_role_id = self.get_role_id(defaults.KS_ADMIN_NAME)
             if admin_role_id is None:
                 message = "The admin user role not found!"
                 self.logger.error(message)
                 return False, message
-            state, message = self.send_role_request_and_check_response(admin_role_id, user_id, method, um_proj_id)
-            if project and project != um_proj_id:
-                state, message = self.send_role_request_and_check_response(admin_role_id, user_id, method, project)
+            role_id_list.append(admin_role_id)
+        project_list = [um_proj_id]
+        if project and project != um_proj_id:
+            project_list.append(project)
+
+        assignments = [(r_id, p_id) for r_id in role_id_list for p_id in project_list]
+        results = self._send_role_requests(assignments, user_id, method)
+        failures = [message for state, message in results if not state]
+        if not failures:
+            return True, "OK"
+
+        done = [assignment for assignment, (state, _) in zip(assignments, results) if state]
+        if done:
+            self.logger.info("Rolling back {0} of the {1} role assignment changes".format(len(done), len(assignments)))
+            undo_method = "delete" if method == "put" else "put"
+            for (r_id, p_id), (state, message) in zip(done, self._send_role_requests(done, user_id, undo_method)):
+                if not state:
+                    self.logger.error("Rollback of the {0} role on the {1} project failed: {2}".format(r_id, p_id,
+                                                                                                     message))
+        return False, failures[0]
+
+    def _send_role_requests(self, assignments, user_id, method):
+        """
+        Sends the grant or revoke requests of the assignments concurrently
 
-        return state, message
+        :param assignments: list of (role id, project id) tuples
+        :param user_id: id of the user
+        :param method: put or delete
+        :returns: (state, message) of each assignment, in the order of the assignments
+        :rtype: list[tuple(bool, str)]
+        """
+        if len(assignments) == 1:
+            role_id, proj_id = assignments[0]
+            return [self.send_role_request_and_check_response(role_id, user_id, method, proj_id)]
+        pool = shared_resources.keystone_pool()
+        futures = [pool.submit(self.send_role_request_and_check_response, role_id, user_id, method, proj_id)
+                   for role_id, proj_id in assignments]
+        return [future.result() for future in futures]
 
     def _close_db(self):
         try:
@@ -229,25 +802,74 @@ class AMApiBase(RestResource):
             return False, err
         return True, "DB opened"
 
+    def is_async(self, args):
+        """
+        Tells whether the client asked for the operation to run as a job
+        """
+        return str(args.get("async")).lower() in ("true", "yes", "1")
+
+    def run_as_job(self, operation, function, args, success_message):
+        """
+        Runs an operation in the background and answers with the id of its job
+
+        :param operation: description of the operation shown in the job state
+        :param function: function returning a (state, message) tuple
+        :param args: arguments of the function
+        :param success_message: description of the job if the function succeeds
+        :returns: the 202 response, or an error if the job cannot be accepted
+        """
+        try:
+            job_id = job_manager.submit(operation, function, args, success_message, self.logger)
+        except JobError as ex:
+            self.logger.error("{0} is refused: {1}".format(operation, ex))
+            return AMApiBase.embed_data({}, 1, "The operation cannot run in the background: {0}".format(ex))
+        if job_id is None:
+            self.logger.error("The job queue is full, {0} is refused".format(operation))
+            return AMApiBase.embed_data({}, 1, "Too many operations are in progress, please try again later.")
+        self.logger.info("{0} is queued as job {1}".format(operation, job_id))
+        return AMApiBase.embed_data({"job_id": job_id}, 0, "Operation accepted."), 202
+
+    def apply_cm_change(self, change, check, timeout=CM_WAIT_TIMEOUT, attempts=CM_WAIT_ATTEMPTS):
+        """
+        Writes a CM property and waits until the change is visible
+        The change is written again if it is not visible within its share of the timeout.
+
+        :param change: function writing the property
+        :param check: function returning True once the change is visible
+        :param timeout: overall deadline in seconds
+        :param attempts: maximum number of writes
+        :returns: True if the change became visible before the deadline
+        """
+        start = time.time()
+        for attempt in range(1, attempts + 1):
+            change()
+            if cm_waiter.wait(check, start + timeout * attempt / float(attempts)):
+                return True
+        return False
+
+    def cm_users(self, list_name):
+        """
+        Returns the chroot or linux user entries of a CM property in the layout of the config
+
+        :param list_name: name of the CM property, e.g. cloud.chroot
+        :rtype: CMUserStore
+        """
+        return CMUserStore(list_name, self.config.get("CM", {}).get("user_layout", CM_LAYOUT_LIST), self.logger)
+
     def check_chroot_linux_state(self, username, list_name, state):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
         self.logger.debug("Start the user list check")
-        self.logger.debug("Checked {0} user list : {1}".format(list_name, json.dumps(user_list)))
-        for val in user_list:
-            if val["name"] == username and val["state"] == state:
-                self.logger.debug("{0} checked!".format(username))
-                return True
+        entry = self.cm_users(list_name).get(username)
+        self.logger.debug("Checked {0} entry of {1}: {2}".format(username, list_name, json.dumps(entry)))
+        if entry is not None and entry["state"] == state:
+            self.logger.debug("{0} checked!".format(username))
+            return True
         self.logger.debug("{0} failed to check!".format(username))
         return False
 
     def auth_keystone(self):
         auth = v3.Token(auth_url=self.config["Keystone"]["auth_uri"],
                         token=self.get_token())
-        sess = session.Session(auth=auth)
-        keystone = client.Client(session=sess)
-        return keystone
+        return shared_resources.keystone_client(auth)
 
     def auth_keystone_with_pass(self, passwd, username=None, uuid=None):
         if not username and not uuid:
@@ -266,22 +888,35 @@ class AMApiBase(RestResource):
                                project_name=defaults.PROJECT_NAME,
                                user_domain_id="default",
                                project_domain_id="default")
-        sess = session.Session(auth=auth)
-        keystone = client.Client(session=sess)
-        return keystone
+        return shared_resources.keystone_client(auth)
 
     def get_uuid_and_name(self, user):
-        try:
-            u_list = self.keystone.users.list()
-        except Exception as ex:
-            self.logger.error("{0}".format(ex))
-            return False, "{0}".format(ex)
-        for element in u_list:
-            if user == element.id or user == element.name:
-                name = element.name
-                id = element.id
-                project = element.default_project_id
-                self.logger.debug("{0},{1},{2}".format(name, id, project))
-                return True, {"name": name, "id": id, "project": project}
+        info = user_directory.get(user)
+        if info is None:
+            try:
+                info = self._fetch_user(user)
+            except Exception as ex:
+                self.logger.error("{0}".format(ex))
+                return False, "{0}".format(ex)
+        if info is not None:
+            self.logger.debug("{0},{1},{2}".format(info["name"], info["id"], info["project"]))
+            return True, info
         self.logger.error("{0} user does not exist in the keystone!".format(user))
         return False, {"{0} user does not exist in the keystone!".format(user)}
+
+    def _fetch_user(self, user):
+        """
+        Gets one user from Keystone by id, or by name if there is no such id, and adds it to the user directory
+
+        :param user: id or name of the user
+        :returns: dict of the name, id and default project of the user, None if the user does not exist
+        :rtype: dict
+        """
+        try:
+            return user_directory.put(self.keystone.users.get(user))
+        except exceptions.http.NotFound:
+            self.logger.debug("No user with {0} id, looking it up by name".format(user))
+        for element in self.keystone.users.list(name=user):
+            if element.name == user:
+                return user_directory.put(element)
+        return None
@@ -0,0 +1,77 @@
+# Copyright 2019 Nokia
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from am_api_base import *
+
+
+class Jobs(AMApiBase):
+
+    """
+    Job state operations
+
+    .. :quickref: Jobs;Job state operations
+
+    .. http:get:: /am/v1/jobs/<job_id>
+
+    **Start Job state**
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+        GET am/v1/jobs/<job_id> HTTP/1.1
+        Host: haproxyvip:61200
+        Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+        HTTP/1.1 200 OK
+        {
+            "code": 0,
+            "description": "Job state.",
+            "data":
+            {
+                "id": <job id>,
+                "operation": "Adding the test_role role to the test user",
+                "state": "succeeded",
+                "description": "Role add to user.",
+                "created": 1554280000.0,
+                "updated": 1554280001.5
+            }
+        }
+
+    :> json int code: the status code
+    :> json string description: the error description, present if code is non zero
+    :> json object data: the state of the job
+    :> json string state: queued, running, succeeded or failed
+    :> json string description: the result of the operation once the job finished
+    """
+
+    endpoints = ['jobs/<job_id>']
+
+    def get(self, job_id):
+        self.logger.info("Received a job state request!")
+        if not self.id_validator(job_id):
+            self.logger.error("Job id validation failed")
+            return AMApiBase.embed_data({}, 1, "Job id validation failed")
+
+        job = job_manager.get(job_id)
+        if job is None:
+            self.logger.error("The {0} job does not exist!".format(job_id))
+            return AMApiBase.embed_data({}, 1, "The {0} job does not exist!".format(job_id))
+
+        del job["pid"]
+        return AMApiBase.embed_data(job, 0, "Job state.")
@@ -258,7 +258,8 @@ class Roles(AMApiBase):
             try:
                 self.db.create_role(args["role_name"], args["desc"])
                 try:
-                    self.keystone.roles.create(args["role_name"])
+                    ks_role = self.keystone.roles.create(args["role_name"])
+                    role_ids.put(args["role_name"], ks_role.id)
                 except Exception as ex:
                     self.db.delete_role(args["role_name"])
                     self.logger.error("Role {} already exists".format(args["role_name"]))
@@ -315,12 +316,14 @@ class Roles(AMApiBase):
                         except Exception as ex:
                             self.logger.error("Some problem occured: {}".format(ex))
                             return False, "Some problem occured: {}".format(ex)
+                        role_ids.remove(args["role_name"])
 
                         try:
                             self.db.delete_role(args["role_name"])
                         except Exception:
                             try:
-                                self.keystone.roles.create(args["role_name"])
+                                ks_role = self.keystone.roles.create(args["role_name"])
+                                role_ids.put(args["role_name"], ks_role.id)
                             except Exception:
                                 self.logger.error("Error during deleting role: {}".format(args["role_name"]))
                                 return False, "Error during deleting role: {}".format(args["role_name"])
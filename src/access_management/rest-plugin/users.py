@@ -12,11 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
 import access_management.db.amdb as amdb
 from am_api_base import *
 from keystoneauth1 import exceptions
-from cmframework.apis import cmclient
 
 
 class Users(AMApiBase):
@@ -141,6 +139,7 @@ class Users(AMApiBase):
         }
 
     :> json string user: The removed user's id or user name.
+    :> json string async: If true, the user is deleted by a job, see /am/v1/jobs/<job_id>.
 
     **Example response**:
 
@@ -162,7 +161,8 @@ class Users(AMApiBase):
                         'email',
                         'user',
                         'project',
-                        'description']
+                        'description',
+                        'async']
 
     def post(self):
         self.logger.info("Received a user create request!")
@@ -211,6 +211,7 @@ class Users(AMApiBase):
 
         for element in u_list:
             user_list.update({element.id : element._info})
+            user_directory.put(element)
 
         self.logger.info("The user list response done!")
         return AMApiBase.embed_data(user_list, 0, "User list.")
@@ -226,6 +227,9 @@ class Users(AMApiBase):
                 self.logger.error("The {0} user tried to delete own account!".format(user_info["id"]))
                 return AMApiBase.embed_data({}, 1, "You cannot delete your own account!")
 
+            if self.is_async(args):
+                return self.run_as_job("Deleting the {0} user".format(user_info["name"]), self._delete_user,
+                                       (user_info,), "User deleted!")
             state, message = self._delete_user(user_info)
 
             if state:
@@ -242,6 +246,7 @@ class Users(AMApiBase):
         state, name = self._delete_user_from_db(user_info)
         if state:
             self.logger.info("User removed from the db!")
+            user_directory.invalidate(user_info["id"])
             try:
                 self.keystone.users.delete(user_info["id"])
             except exceptions.http.NotFound as ex:
@@ -263,21 +268,19 @@ class Users(AMApiBase):
                 for role in roles:
                     if self.db.is_chroot_role(role):
                         self.logger.debug("This user has a chroot role.")
-                        for x in range(3):
-                            self.remove_chroot_linux_role_handling(user_info["id"], "Chroot", "cloud.chroot")
-                            time.sleep(2)
-                            if self.check_chroot_linux_state(user_info["name"], "cloud.chroot", "absent"):
-                                self.db.delete_user(user_info["id"])
-                                return True, user_info["name"]
+                        if self.apply_cm_change(
+                                lambda: self.remove_chroot_linux_role_handling(user_info["id"], "Chroot", "cloud.chroot"),
+                                lambda: self.check_chroot_linux_state(user_info["name"], "cloud.chroot", "absent")):
+                            self.db.delete_user(user_info["id"])
+                            return True, user_info["name"]
 
                     if role == "linux_user":
                         self.logger.debug("This user has a linux_user role!")
-                        for x in range(3):
-                            self.remove_chroot_linux_role_handling(user_info["id"], "Linux", "cloud.linuxuser")
-                            time.sleep(2)
-                            if self.check_chroot_linux_state(user_info["name"], "cloud.linuxuser", "absent"):
-                                self.db.delete_user(user_info["id"])
-                                return True, user_info["name"]
+                        if self.apply_cm_change(
+                                lambda: self.remove_chroot_linux_role_handling(user_info["id"], "Linux", "cloud.linuxuser"),
+                                lambda: self.check_chroot_linux_state(user_info["name"], "cloud.linuxuser", "absent")):
+                            self.db.delete_user(user_info["id"])
+                            return True, user_info["name"]
 
                 self.db.delete_user(user_info["id"])
             except amdb.NotAllowedOperation:
@@ -332,6 +335,7 @@ class Users(AMApiBase):
             return False, "{0}".format(ex)
 
         ID = c_user_out.id
+        user_directory.invalidate(args["username"])
         state, message = self._add_basic_roles(um_proj_id, ID, roles)
         if not state:
             return False, message
@@ -392,20 +396,14 @@ class Users(AMApiBase):
             return False, message_open
 
     def remove_chroot_linux_role_handling(self, user_id, user_type, list_name):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
-        self.logger.debug("{0} user list before the change: {1}".format(user_type, json.dumps(user_list)))
-        if user_list is not None:
-            self.logger.debug("The {0} user list exists!".format(user_type))
-            username, def_project = self.get_user_from_uuid(user_id)
-            self.logger.debug("User name: {0}".format(username))
-            for val in user_list:
-                if val["name"] == username:
-                    val["public_key"] = ""
-                    val["state"] = "absent"
-                    val["remove"] = "yes"
-                    val["password"] = ""
-                    break
-            self.logger.debug("{0} user list after the change: {1}".format(user_type, json.dumps(user_list)))
-            cmc.set_property(list_name, json.dumps(user_list))
+        users = self.cm_users(list_name)
+        username, def_project = self.get_user_from_uuid(user_id)
+        self.logger.debug("User name: {0}".format(username))
+        val = users.get(username)
+        self.logger.debug("{0} user entry before the change: {1}".format(user_type, json.dumps(val)))
+        if val is not None:
+            val["public_key"] = ""
+            val["state"] = "absent"
+            val["remove"] = "yes"
+            val["password"] = ""
+            users.put(val)
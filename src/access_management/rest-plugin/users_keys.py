@@ -13,7 +13,6 @@
 # limitations under the License.
 
 from am_api_base import *
-from cmframework.apis import cmclient
 
 
 class UsersKeys(AMApiBase):
@@ -157,15 +156,9 @@ class UsersKeys(AMApiBase):
             return False, message_open
 
     def key_handler(self, username, user_type, list_name, key):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
-        self.logger.debug("{0} user list before the change: {1}".format(user_type, json.dumps(user_list)))
-        if user_list:
-            self.logger.debug("The {0} user list exists!".format(user_type))
-            for val in user_list:
-                if val["name"] == username:
-                    val["public_key"] = key
-                    break
-            self.logger.debug("{0} user list after the change: {1}".format(user_type, json.dumps(user_list)))
-            cmc.set_property(list_name, json.dumps(user_list))
+        users = self.cm_users(list_name)
+        val = users.get(username)
+        self.logger.debug("{0} user entry before the change: {1}".format(user_type, json.dumps(val)))
+        if val is not None:
+            val["public_key"] = key
+            users.put(val)
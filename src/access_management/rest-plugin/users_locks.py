@@ -15,7 +15,6 @@
 import json
 from am_api_base import *
 from keystoneauth1 import exceptions
-from cmframework.apis import cmclient
 
 
 class UserLock(AMApiBase):
@@ -177,15 +176,9 @@ class UserLock(AMApiBase):
             return False, message_open
 
     def lock_state_handler(self, username, user_type, list_name, state):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
-        self.logger.debug("{0} user list before the change: {1}".format(user_type, json.dumps(user_list)))
-        if user_list is not None:
-            self.logger.debug("The {0} user list exists!".format(user_type))
-            for val in user_list:
-                if val["name"] == username:
-                    val["lock_state"] = state
-                    break
-            self.logger.debug("{0} user list after the change: {1}".format(user_type, json.dumps(user_list)))
-            cmc.set_property(list_name, json.dumps(user_list))
+        users = self.cm_users(list_name)
+        val = users.get(username)
+        self.logger.debug("{0} user entry before the change: {1}".format(user_type, json.dumps(val)))
+        if val is not None:
+            val["lock_state"] = state
+            users.put(val)
@@ -18,7 +18,6 @@ import requests
 import access_management.db.amdb as amdb
 from am_api_base import *
 from keystoneauth1 import exceptions
-from cmframework.apis import cmclient
 
 
 class UsersOwnpasswords(AMApiBase):
@@ -181,16 +180,10 @@ class UsersOwnpasswords(AMApiBase):
         return True
 
     def linux_chroot_pass_handling(self, user_type, list_name, passwd, username):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
-        self.logger.debug("{0} user list before the change: {1}".format(user_type, json.dumps(user_list)))
-        if user_list is not None:
-            self.logger.debug("The {0} user list exists!".format(user_type))
-            self.logger.debug("Username: {0}".format(username))
-            for val in user_list:
-                if val["name"] == username:
-                    val["password"] = crypt.crypt(passwd, crypt.mksalt(crypt.METHOD_SHA512))
-                    break
-            self.logger.debug("{0} user list after the change: {1}".format(user_type, json.dumps(user_list)))
-            cmc.set_property(list_name, json.dumps(user_list))
+        users = self.cm_users(list_name)
+        self.logger.debug("Username: {0}".format(username))
+        val = users.get(username)
+        if val is not None:
+            self.logger.debug("The {0} user has an entry in {1}".format(user_type, list_name))
+            val["password"] = crypt.crypt(passwd, crypt.mksalt(crypt.METHOD_SHA512))
+            users.put(val)
@@ -115,4 +115,6 @@ class UsersParameters(AMApiBase):
         except Exception as ex:
             self.logger.error("KS general error: {0}".format(ex))
             return False, "{0}".format(ex)
+        finally:
+            user_directory.invalidate(user_info["id"])
         return True, "Updated!"
@@ -14,10 +14,10 @@
 
 import json
 import crypt
-import time
 from am_api_base import *
 from keystoneauth1 import exceptions
-from cmframework.apis import cmclient
+
+PASSWORD_CM_WAIT_TIMEOUT = 15
 
 
 class UsersPasswords(AMApiBase):
@@ -45,6 +45,7 @@ class UsersPasswords(AMApiBase):
 
     :> json string user: The user's id or name.
     :> json string npassword: The user's new password
+    :> json string async: If true, the password is reset by a job, see /am/v1/jobs/<job_id>.
 
     **Example response**:
 
@@ -62,7 +63,8 @@ class UsersPasswords(AMApiBase):
 
     endpoints = ['users/passwords']
     parser_arguments = ['user',
-                        'npassword']
+                        'npassword',
+                        'async']
 
     def post(self):
         self.logger.info("Received a reset password request!")
@@ -75,6 +77,10 @@ class UsersPasswords(AMApiBase):
 
         state, user_info = self.get_uuid_and_name(args["user"])
         if state:
+            if self.is_async(args):
+                return self.run_as_job("Resetting the password of the {0} user".format(user_info["name"]),
+                                       self._reset_pass, (user_info, args['npassword']),
+                                       "Password reset successfully!")
             status, message = self._reset_pass(user_info, args['npassword'])
 
             if status:
@@ -107,19 +113,19 @@ class UsersPasswords(AMApiBase):
                 for role in roles:
                     if self.db.is_chroot_role(role):
                         # if the user has a chroot account, change the pwd of that also
-                        for x in range(3):
-                            self.linux_chroot_pass_handling(user_info["name"], "Chroot", "cloud.chroot", passwd_hash)
-                            time.sleep(5)
-                            if self.check_chroot_linux_pass_state(user_info["name"], "cloud.chroot", passwd_hash):
-                                return True, "Success"
+                        if self.apply_cm_change(
+                                lambda: self.linux_chroot_pass_handling(user_info["name"], "Chroot", "cloud.chroot", passwd_hash),
+                                lambda: self.check_chroot_linux_pass_state(user_info["name"], "cloud.chroot", passwd_hash),
+                                timeout=PASSWORD_CM_WAIT_TIMEOUT):
+                            return True, "Success"
                         return False, "The user handler is busy, please try again."
                     if role == "linux_user":
                         # if the user has a Linux user account, change the pwd of that also
-                        for x in range(3):
-                            self.linux_chroot_pass_handling(user_info["name"], "Linux", "cloud.linuxuser", passwd_hash)
-                            time.sleep(5)
-                            if self.check_chroot_linux_pass_state(user_info["name"], "cloud.linuxuser", passwd_hash):
-                                return True, "Success"
+                        if self.apply_cm_change(
+                                lambda: self.linux_chroot_pass_handling(user_info["name"], "Linux", "cloud.linuxuser", passwd_hash),
+                                lambda: self.check_chroot_linux_pass_state(user_info["name"], "cloud.linuxuser", passwd_hash),
+                                timeout=PASSWORD_CM_WAIT_TIMEOUT):
+                            return True, "Success"
                         return False, "The user handler is busy, please try again."
             except Exception as ex:
                 self.logger.error("Internal error: {0}".format(ex))
@@ -133,27 +139,18 @@ class UsersPasswords(AMApiBase):
             return False, message_open
 
     def linux_chroot_pass_handling(self, username, user_type, list_name, passwd):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
-        self.logger.debug("{0} user list before the change: {1}".format(user_type, json.dumps(user_list)))
-        if user_list is not None:
-            self.logger.debug("The {0} user list exist!".format(user_type))
-            for val in user_list:
-                if val["name"] == username:
-                    val["password"] = passwd
-                    break
-            self.logger.debug("{0} user list after the change: {1}".format(user_type, json.dumps(user_list)))
-            cmc.set_property(list_name, json.dumps(user_list))
+        users = self.cm_users(list_name)
+        val = users.get(username)
+        if val is not None:
+            self.logger.debug("The {0} user has an entry in {1}".format(user_type, list_name))
+            val["password"] = passwd
+            users.put(val)
 
     def check_chroot_linux_pass_state(self, username, list_name, password):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
         self.logger.debug("Start the user list check")
-        for val in user_list:
-            if val["name"] == username and val["password"] == password:
-                self.logger.debug("{0} user's password changed!".format(username))
-                return True
+        val = self.cm_users(list_name).get(username)
+        if val is not None and val["password"] == password:
+            self.logger.debug("{0} user's password changed!".format(username))
+            return True
         self.logger.debug("{0} user's password is not changed!".format(username))
         return False
@@ -12,10 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
 import access_management.db.amdb as amdb
 from am_api_base import *
-from cmframework.apis import cmclient
 
 
 class UsersRoles(AMApiBase):
@@ -43,6 +41,7 @@ class UsersRoles(AMApiBase):
 
     :> json string user: The user's id or name.
     :> json string role_name: The user's new role.
+    :> json string async: If true, the role is added by a job, see /am/v1/jobs/<job_id>.
 
     **Example response**:
 
@@ -57,6 +56,17 @@ class UsersRoles(AMApiBase):
     :> json int code: the status code
     :> json string description: the error description, present if code is non zero
 
+    **Example response with async**:
+
+    .. sourcecode:: http
+
+        HTTP/1.1 202 Accepted
+        {
+            "code": 0,
+            "description": "Operation accepted.",
+            "data": {"job_id": <job id>}
+        }
+
     User remove role operations
 
     .. :quickref: User roles;User remove role operations
@@ -79,6 +89,7 @@ class UsersRoles(AMApiBase):
 
     :> json string user: The user's id or name.
     :> json string role_name: Remove this role from the user.
+    :> json string async: If true, the role is removed by a job, see /am/v1/jobs/<job_id>.
 
     **Example response**:
 
@@ -96,7 +107,8 @@ class UsersRoles(AMApiBase):
 
     endpoints = ['users/roles']
     parser_arguments = ['user',
-                        'role_name']
+                        'role_name',
+                        'async']
 
     def post(self):
         self.logger.info("Received a user add role request!")
@@ -109,6 +121,9 @@ class UsersRoles(AMApiBase):
         state, user_info = self.get_uuid_and_name(args["user"])
         if state:
             username, def_project = self.get_user_from_uuid(user_info["id"])
+            if self.is_async(args):
+                return self.run_as_job("Adding the {0} role to the {1} user".format(args["role_name"], user_info["name"]),
+                                       self._add_role, (args['role_name'], def_project, user_info), "Role add to user.")
             state, message = self._add_role(args['role_name'], def_project, user_info)
 
             if state:
@@ -137,6 +152,10 @@ class UsersRoles(AMApiBase):
                 return AMApiBase.embed_data({}, 1, "You cannot remove own "+defaults.INF_ADMIN_ROLE_NAME+" role!")
 
             username, def_project = self.get_user_from_uuid(user_info["id"])
+            if self.is_async(args):
+                return self.run_as_job("Removing the {0} role from the {1} user".format(args["role_name"], user_info["name"]),
+                                       self._remove_role, (args["role_name"], def_project, user_info),
+                                       "Role removed from user.")
             state, message = self._remove_role(args["role_name"], def_project, user_info)
 
             if state:
@@ -171,24 +190,22 @@ class UsersRoles(AMApiBase):
                 self.logger.debug("Check the chroot role, when removing a role!")
                 if self.db.is_chroot_role(role_name):
                     self.logger.debug("This is a chroot role!")
-                    for x in range(3):
-                        self.remove_chroot_linux_role_handling(user_info["name"], "Chroot", "cloud.chroot")
-                        time.sleep(2)
-                        if self.check_chroot_linux_state(user_info["name"], "cloud.chroot", "absent"):
-                            self.db.delete_user_role(user_info["id"], role_name)
-                            return True, "Success"
+                    if self.apply_cm_change(
+                            lambda: self.remove_chroot_linux_role_handling(user_info["name"], "Chroot", "cloud.chroot"),
+                            lambda: self.check_chroot_linux_state(user_info["name"], "cloud.chroot", "absent")):
+                        self.db.delete_user_role(user_info["id"], role_name)
+                        return True, "Success"
 
                     self.logger.error("The {0} user cannot remove {1} role, because the cm framework set_property's function failed.".format(user_info["name"], role_name))
                     return False, "The chroot user is not removed. Please try again!"
 
                 if role_name == "linux_user":
                     self.logger.debug("This is a linux_user role!")
-                    for x in range(3):
-                        self.remove_chroot_linux_role_handling(user_info["name"], "Linux", "cloud.linuxuser")
-                        time.sleep(2)
-                        if self.check_chroot_linux_state(user_info["name"], "cloud.linuxuser", "absent"):
-                            self.db.delete_user_role(user_info["id"], role_name)
-                            return True, "Success"
+                    if self.apply_cm_change(
+                            lambda: self.remove_chroot_linux_role_handling(user_info["name"], "Linux", "cloud.linuxuser"),
+                            lambda: self.check_chroot_linux_state(user_info["name"], "cloud.linuxuser", "absent")):
+                        self.db.delete_user_role(user_info["id"], role_name)
+                        return True, "Success"
 
                     self.logger.error("The {0} user cannot remove {1} role, because the cm framework set_property's function failed.".format(user_info["name"], role_name))
                     return False, "The linux user is not removed. Please try again!"
@@ -235,11 +252,10 @@ class UsersRoles(AMApiBase):
                         self.db.delete_user_role(user_info["id"], role_name)
                         return False, "The {0} user cannot get {1} chroot role, because this user has a linux_user role".format(user_info["name"], role_name)
 
-                    for x in range(3):
-                        self.add_chroot_linux_role_handling(user_info["id"], "Chroot", "cloud.chroot", role_name)
-                        time.sleep(2)
-                        if self.check_chroot_linux_state(user_info["name"], "cloud.chroot", "present"):
-                            return True, "Success"
+                    if self.apply_cm_change(
+                            lambda: self.add_chroot_linux_role_handling(user_info["id"], "Chroot", "cloud.chroot", role_name),
+                            lambda: self.check_chroot_linux_state(user_info["name"], "cloud.chroot", "present")):
+                        return True, "Success"
 
                     self.db.delete_user_role(user_info["id"], role_name)
                     self.logger.error("The {0} user cannot get {1} role, because the cm framework set_property's function failed.".format(user_info["name"], role_name))
@@ -259,11 +275,10 @@ class UsersRoles(AMApiBase):
                         self.db.delete_user_role(user_info["id"], role_name)
                         return False, "The {0} user cannot get {1} role, because this user has a chroot role".format(user_info["name"], role_name)
 
-                    for x in range(3):
-                        self.add_chroot_linux_role_handling(user_info["id"], "Linux", "cloud.linuxuser", None)
-                        time.sleep(2)
-                        if self.check_chroot_linux_state(user_info["name"], "cloud.linuxuser", "present"):
-                            return True, "Success"
+                    if self.apply_cm_change(
+                            lambda: self.add_chroot_linux_role_handling(user_info["id"], "Linux", "cloud.linuxuser", None),
+                            lambda: self.check_chroot_linux_state(user_info["name"], "cloud.linuxuser", "present")):
+                        return True, "Success"
 
                     self.db.delete_user_role(user_info["id"], role_name)
                     self.logger.error("The {0} user cannot get {1} role, because the cm framework set_property's function failed.".format(user_info["name"], role_name))
@@ -284,51 +299,35 @@ class UsersRoles(AMApiBase):
             return False, message_open
 
     def add_chroot_linux_role_handling(self, user_id, user_type, list_name, group):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        if user_list is None:
-            cmc.set_property(list_name, json.dumps([]))
-            user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
-        self.logger.debug("{0} user list before the change: {1}".format(user_type, json.dumps(user_list)))
-        add = True
-        self.logger.debug("The {0} user list exists!".format(user_type))
+        users = self.cm_users(list_name)
         username, def_project = self.get_user_from_uuid(user_id)
         self.logger.debug("Username: {0}".format(username))
-        for element in user_list:
-            if element["name"] == username:
-                if element["state"] == "present":
-                    self.logger.error("The {0} user has an active {1} chroot role".format(username, element["group"]))
-                    self.db.delete_user_role(user_id, group)
-                    return False, "The {0} users have an active {1} chroot role".format(username, element["group"])
-                else:
-                    self.logger.debug("The {0} user has an active linux_user role".format(username))
-                    if group is not None:
-                        element["group"] = group
-                    element["state"] = "present"
-                    element["remove"] = "no"
-                    add = False
-        if add:
-            new_user = {"name": username, "password": "", "state": "present", "remove": "no", "lock_state": "-u", "public_key": ""}
+        element = users.get(username)
+        self.logger.debug("{0} user entry before the change: {1}".format(user_type, json.dumps(element)))
+        if element is not None:
+            if element["state"] == "present":
+                self.logger.error("The {0} user has an active {1} chroot role".format(username, element["group"]))
+                self.db.delete_user_role(user_id, group)
+                return False, "The {0} users have an active {1} chroot role".format(username, element["group"])
+            else:
+                self.logger.debug("The {0} user has an active linux_user role".format(username))
+                if group is not None:
+                    element["group"] = group
+                element["state"] = "present"
+                element["remove"] = "no"
+        else:
+            element = {"name": username, "password": "", "state": "present", "remove": "no", "lock_state": "-u", "public_key": ""}
             if group is not None:
-                new_user["group"]= group
-            user_list.append(new_user)
-        self.logger.debug("{0} user list after the change: {1}".format(user_type, json.dumps(user_list)))
-        cmc.set_property(list_name, json.dumps(user_list))
+                element["group"]= group
+        users.put(element)
 
     def remove_chroot_linux_role_handling(self, username, user_type, list_name):
-        cmc = cmclient.CMClient()
-        user_list = cmc.get_property(list_name)
-        user_list = json.loads(user_list)
-        self.logger.debug("{0} user list before the change: {1}".format(user_type, json.dumps(user_list)))
-        if user_list is not None:
-            self.logger.debug("The {0} user list exists!".format(user_type))
-            for val in user_list:
-                if val["name"] == username:
-                    val["public_key"] = ""
-                    val["state"] = "absent"
-                    val["remove"] = "yes"
-                    val["password"] = ""
-                    break
-            self.logger.debug("{0} user list after the change: {1}".format(user_type, json.dumps(user_list)))
-            cmc.set_property(list_name, json.dumps(user_list))
+        users = self.cm_users(list_name)
+        val = users.get(username)
+        self.logger.debug("{0} user entry before the change: {1}".format(user_type, json.dumps(val)))
+        if val is not None:
+            val["public_key"] = ""
+            val["state"] = "absent"
+            val["remove"] = "yes"
+            val["password"] = ""
+            users.put(val)
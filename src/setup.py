@@ -27,10 +27,11 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     description='Access Management for Akraino REC blueprint',
-    install_requires=['flask', 'flask-restful', 'hostcli'],
+    install_requires=['flask', 'flask-restful', 'hostcli', 'gunicorn', 'futures'],
     entry_points={
         'console_scripts': [
             'auth-server = access_management.backend.authserver:main',
+            'auth-server-wsgi = access_management.backend.wsgiserver:main',
         ],
         'hostcli.commands': [
             'user create = access_management.cli.cli:CreateNewUser',